@@ -11,7 +11,9 @@ from app.database import Base
 from app.models import *
 
 config = context.config
-fileConfig(config.config_file_name)
+# Skipped when run from the API process (see app.migrations)
+if config.attributes.get("configure_logger", True):
+    fileConfig(config.config_file_name)
 target_metadata = Base.metadata
 
 def run_migrations_offline():
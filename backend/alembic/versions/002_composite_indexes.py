@@ -0,0 +1,61 @@
+"""Composite indexes for jobs and renders query patterns
+
+Revision ID: 002
+Revises: 001
+Create Date: 2025-01-15 00:00:00.000000
+
+Indexes are built with CREATE INDEX CONCURRENTLY, which cannot run inside
+a transaction, so every statement goes through an autocommit block. This
+keeps reads and writes flowing while the indexes build. Index migrations
+after this one should follow the same pattern.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '002'
+down_revision = '001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        # Job listing: WHERE video_id = ? ORDER BY created_at DESC
+        op.create_index(
+            'ix_jobs_video_id_created_at', 'jobs', ['video_id', sa.text('created_at DESC')],
+            postgresql_concurrently=True, if_not_exists=True
+        )
+        # "Analysis already in progress" check
+        op.create_index(
+            'ix_jobs_video_type_status', 'jobs', ['video_id', 'type', 'status'],
+            postgresql_concurrently=True, if_not_exists=True
+        )
+        # Concurrent-render count
+        op.create_index(
+            'ix_renders_user_status', 'renders', ['user_id', 'status'],
+            postgresql_concurrently=True, if_not_exists=True
+        )
+        # Render listing: WHERE user_id = ? ORDER BY created_at DESC
+        op.create_index(
+            'ix_renders_user_created', 'renders', ['user_id', sa.text('created_at DESC')],
+            postgresql_concurrently=True, if_not_exists=True
+        )
+        # Redundant now that both jobs composites lead with video_id
+        op.drop_index(
+            'ix_jobs_video_id', table_name='jobs',
+            postgresql_concurrently=True, if_exists=True
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_jobs_video_id', 'jobs', ['video_id'],
+            postgresql_concurrently=True, if_not_exists=True
+        )
+        op.drop_index('ix_renders_user_created', table_name='renders', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_renders_user_status', table_name='renders', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_jobs_video_type_status', table_name='jobs', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_jobs_video_id_created_at', table_name='jobs', postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,33 @@
+"""Partial index for active renders per user
+
+Revision ID: 003
+Revises: 002
+Create Date: 2025-01-20 00:00:00.000000
+
+The concurrent-render limit counts a user's pending/processing renders on
+every render request. A partial index over only those rows keeps the count
+proportional to active renders rather than the user's render history.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '003'
+down_revision = '002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_renders_user_active', 'renders', ['user_id'],
+            postgresql_where=sa.text("status IN ('pending', 'processing')"),
+            postgresql_concurrently=True, if_not_exists=True
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_renders_user_active', table_name='renders', postgresql_concurrently=True, if_exists=True)
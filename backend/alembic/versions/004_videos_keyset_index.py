@@ -0,0 +1,42 @@
+"""Keyset pagination index for video listing
+
+Revision ID: 004
+Revises: 003
+Create Date: 2025-01-22 00:00:00.000000
+
+list_videos pages on (created_at, id) per user, newest first, so the
+index matches that ordering exactly and the range scan never sorts.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '004'
+down_revision = '003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        # Video listing: WHERE user_id = ? AND (created_at, id) < (?, ?)
+        op.create_index(
+            'ix_videos_user_created_id', 'videos',
+            ['user_id', sa.text('created_at DESC'), sa.text('id DESC')],
+            postgresql_concurrently=True, if_not_exists=True
+        )
+        # Redundant now that the composite leads with user_id
+        op.drop_index(
+            'ix_videos_user_id', table_name='videos',
+            postgresql_concurrently=True, if_exists=True
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_videos_user_id', 'videos', ['user_id'],
+            postgresql_concurrently=True, if_not_exists=True
+        )
+        op.drop_index('ix_videos_user_created_id', table_name='videos', postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,42 @@
+"""Score-ordered index for candidate listing
+
+Revision ID: 005
+Revises: 004
+Create Date: 2025-01-23 00:00:00.000000
+
+get_video_candidates filters on video_id and sorts (or keyset-pages) by
+(score, id) descending; this index serves both without a sort step.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '005'
+down_revision = '004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        # Candidate listing: WHERE video_id = ? ORDER BY score DESC, id DESC
+        op.create_index(
+            'ix_candidates_video_score', 'candidates',
+            ['video_id', sa.text('score DESC'), sa.text('id DESC')],
+            postgresql_concurrently=True, if_not_exists=True
+        )
+        # Redundant now that the composite leads with video_id
+        op.drop_index(
+            'ix_candidates_video_id', table_name='candidates',
+            postgresql_concurrently=True, if_exists=True
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_candidates_video_id', 'candidates', ['video_id'],
+            postgresql_concurrently=True, if_not_exists=True
+        )
+        op.drop_index('ix_candidates_video_score', table_name='candidates', postgresql_concurrently=True, if_exists=True)
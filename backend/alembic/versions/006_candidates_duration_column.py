@@ -0,0 +1,45 @@
+"""Stored duration column for candidate sorting
+
+Revision ID: 006
+Revises: 005
+Create Date: 2025-01-24 00:00:00.000000
+
+Sorting candidates by (end_s - start_s) computed the expression per row
+and always needed a full sort. A stored generated column lets an index
+on (video_id, duration_s DESC) serve the duration sort directly.
+
+Adding a stored generated column rewrites the candidates table under an
+ACCESS EXCLUSIVE lock, so run this in a low-traffic window. The index is
+then built concurrently like the other index migrations.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '006'
+down_revision = '005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        'candidates',
+        sa.Column('duration_s', sa.Float(), sa.Computed('end_s - start_s', persisted=True))
+    )
+    
+    with op.get_context().autocommit_block():
+        # Candidate listing: WHERE video_id = ? ORDER BY duration_s DESC
+        op.create_index(
+            'ix_candidates_video_duration', 'candidates',
+            ['video_id', sa.text('duration_s DESC')],
+            postgresql_concurrently=True, if_not_exists=True
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_candidates_video_duration', table_name='candidates', postgresql_concurrently=True, if_exists=True)
+    
+    op.drop_column('candidates', 'duration_s')
@@ -0,0 +1,46 @@
+"""Covering index for video listing
+
+Revision ID: 007
+Revises: 006
+Create Date: 2025-01-27 00:00:00.000000
+
+Replaces ix_videos_user_created_id with the same key plus INCLUDE of the
+columns list_videos returns, so listing pages are index-only scans.
+VACUUM ANALYZE afterwards sets the visibility map that index-only scans
+rely on.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '007'
+down_revision = '006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_videos_user_created_covering', 'videos',
+            ['user_id', sa.text('created_at DESC'), sa.text('id DESC')],
+            postgresql_include=['title', 'duration', 'resolution'],
+            postgresql_concurrently=True, if_not_exists=True
+        )
+        # Superseded by the covering index (same key columns)
+        op.drop_index(
+            'ix_videos_user_created_id', table_name='videos',
+            postgresql_concurrently=True, if_exists=True
+        )
+        op.execute('VACUUM ANALYZE videos')
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_videos_user_created_id', 'videos',
+            ['user_id', sa.text('created_at DESC'), sa.text('id DESC')],
+            postgresql_concurrently=True, if_not_exists=True
+        )
+        op.drop_index('ix_videos_user_created_covering', table_name='videos', postgresql_concurrently=True, if_exists=True)
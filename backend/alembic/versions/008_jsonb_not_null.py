@@ -0,0 +1,45 @@
+"""Backfill and require JSONB defaults
+
+Revision ID: 008
+Revises: 007
+Create Date: 2025-01-28 00:00:00.000000
+
+jobs.logs, candidates.features and renders.files now default to a fresh
+{} per row and are NOT NULL. Existing NULLs are backfilled in batches of
+1000 (each committed on its own) so no single UPDATE holds row locks on a
+large table. SET NOT NULL then scans each table once under a short lock.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '008'
+down_revision = '007'
+branch_labels = None
+depends_on = None
+
+COLUMNS = [('jobs', 'logs'), ('candidates', 'features'), ('renders', 'files')]
+BATCH_SIZE = 1000
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        op.execute("SET lock_timeout = '5s'")
+        for table, column in COLUMNS:
+            while True:
+                result = op.get_bind().execute(sa.text(
+                    f"UPDATE {table} SET {column} = '{{}}'::jsonb "
+                    f"WHERE id IN (SELECT id FROM {table} WHERE {column} IS NULL LIMIT {BATCH_SIZE})"
+                ))
+                if result.rowcount == 0:
+                    break
+        
+        for table, column in COLUMNS:
+            op.alter_column(table, column, nullable=False)
+        op.execute("RESET lock_timeout")
+
+
+def downgrade():
+    for table, column in COLUMNS:
+        op.alter_column(table, column, nullable=True)
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel, EmailStr
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
@@ -63,9 +64,9 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
     return encoded_jwt
 
 
-def get_current_user(
+async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> User:
     """Dependency to get the current authenticated user"""
     credentials_exception = HTTPException(
@@ -84,7 +85,9 @@ def get_current_user(
     except JWTError:
         raise credentials_exception
     
-    user = db.query(User).filter(User.email == token_data.email).first()
+    user = (await db.execute(
+        select(User).where(User.email == token_data.email)
+    )).scalar_one_or_none()
     if user is None:
         raise credentials_exception
     
@@ -92,7 +95,7 @@ def get_current_user(
 
 
 @router.post("/register", response_model=Token, status_code=status.HTTP_201_CREATED)
-async def register(user_data: UserRegister, db: Session = Depends(get_db)):
+async def register(user_data: UserRegister, db: AsyncSession = Depends(get_db)):
     """
     Register a new user
     
@@ -100,7 +103,9 @@ async def register(user_data: UserRegister, db: Session = Depends(get_db)):
     - **password**: Password (min 8 characters recommended)
     """
     # Check if user already exists
-    existing_user = db.query(User).filter(User.email == user_data.email).first()
+    existing_user = (await db.execute(
+        select(User.id).where(User.email == user_data.email)
+    )).scalar_one_or_none()
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -122,8 +127,7 @@ async def register(user_data: UserRegister, db: Session = Depends(get_db)):
     )
     
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
     
     # Create access token
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -139,14 +143,16 @@ async def register(user_data: UserRegister, db: Session = Depends(get_db)):
 
 
 @router.post("/login", response_model=Token)
-async def login(user_data: UserLogin, db: Session = Depends(get_db)):
+async def login(user_data: UserLogin, db: AsyncSession = Depends(get_db)):
     """
     Login with email and password
     
     Returns JWT access token for authenticated requests
     """
     # Find user
-    user = db.query(User).filter(User.email == user_data.email).first()
+    user = (await db.execute(
+        select(User).where(User.email == user_data.email)
+    )).scalar_one_or_none()
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -183,7 +189,7 @@ async def get_current_user_info(current_user: User = Depends(get_current_user)):
     Requires authentication
     """
     return {
-        "id": str(current_user.id),
+        "id": current_user.id,
         "email": current_user.email,
         "created_at": current_user.created_at
     }
@@ -1,79 +1,117 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from pydantic import BaseModel
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import exists, insert, select
+from sqlalchemy.orm import contains_eager, load_only
+from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import UUID4, BaseModel, ConfigDict, Field
 from typing import Optional, Dict, List
-import yaml
+from datetime import datetime
+from uuid import UUID
+import orjson
 
+from app.config import get_config
 from app.database import get_db
 from app.models import User, Video, Job
 from app.api.auth import get_current_user
-from app.workers.analyzer import analyze_video_task
+from app.utils.pagination import keyset_page, keyset_paginate
+from app.services.s3_service import put_json_async
+from app.workers.analyzer import analysis_task
+from app.workers.celery_app import TASK_ARG_INLINE_LIMIT
 
 router = APIRouter()
 
 
 class AnalyzeRequest(BaseModel):
-    video_id: str
+    model_config = ConfigDict(extra='forbid')
+    
+    video_id: UUID4
     keywords: Optional[List[str]] = []
     targets: Optional[Dict] = {}
 
 
 class AnalyzeResponse(BaseModel):
-    job_id: str
-    video_id: str
+    job_id: UUID
+    video_id: UUID
     status: str
     message: str
 
 
 class JobStatus(BaseModel):
-    job_id: str
-    video_id: str
+    # Read straight off Job rows; job_id maps to the Job.id attribute
+    model_config = ConfigDict(from_attributes=True, populate_by_name=True, extra='forbid')
+    
+    job_id: UUID = Field(validation_alias='id')
+    video_id: UUID
     type: str
     status: str
     progress: int
     logs: dict
-    created_at: str
+    created_at: datetime
+
+
+class JobPage(BaseModel):
+    items: List[JobStatus]
+    next_cursor: Optional[str]
+
+
+async def get_owned_job(db: AsyncSession, job_id: UUID, user_id, *options) -> Job:
+    """
+    Fetch a job and verify the user owns its video in a single JOIN
+    
+    Raises 404 if the job doesn't exist and 403 if it belongs to another
+    user. The extra existence probe only runs when the JOIN misses.
+    """
+    # Populate job.video from the JOIN itself so no lazy load can fire
+    job = (await db.execute(
+        select(Job).join(Video, Video.id == Job.video_id).options(
+            contains_eager(Job.video), *options
+        ).where(
+            Job.id == job_id,
+            Video.user_id == user_id
+        )
+    )).scalar_one_or_none()
+    
+    if job:
+        return job
+    
+    # Slow path: distinguish a missing job from someone else's job
+    job_exists = (await db.execute(
+        select(exists().where(Job.id == job_id))
+    )).scalar()
+    
+    if not job_exists:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
     
-    class Config:
-        from_attributes = True
+    raise HTTPException(
+        status_code=status.HTTP_403_FORBIDDEN,
+        detail="Access denied"
+    )
 
 
-def load_config():
-    """Load configuration from config.yaml"""
-    try:
-        with open('config.yaml', 'r') as f:
-            return yaml.safe_load(f)
-    except FileNotFoundError:
-        # Return default config if file doesn't exist
-        return {
-            'analysis': {
-                'clip_min_s': 7,
-                'clip_max_s': 15,
-                'target_s': 10,
-                'candidates_per_minute': 4,
-                'max_candidates': 20
-            },
-            'scoring': {
-                'weights': {
-                    'speech_hook': 0.30,
-                    'motion': 0.25,
-                    'audio_peak': 0.20,
-                    'keyword_match': 0.15,
-                    'scene_freshness': 0.10
-                }
-            },
-            'whisper': {
-                'model': 'base',
-                'language': 'auto'
-            }
-        }
+async def enqueue_analysis(job_id: UUID, video_id: UUID, config: dict):
+    """
+    Queue the analysis task, passing the config via S3 if it's too big for the broker
+    
+    The worker deletes the object when the task ends; a lifecycle rule on
+    task-args/ (see setup_script.sh) expires any left by killed workers.
+    """
+    task_kwargs = {'job_id': str(job_id), 'video_id': str(video_id)}
+    if len(orjson.dumps(config)) > TASK_ARG_INLINE_LIMIT:
+        task_kwargs['config_key'] = await put_json_async(f"task-args/{job_id}/config.json", config)
+    else:
+        task_kwargs['config'] = config
+    
+    analysis_task.apply_async(kwargs=task_kwargs, task_id=str(job_id))
 
 
 @router.post("/jobs/analyze", response_model=AnalyzeResponse, status_code=status.HTTP_201_CREATED)
 async def start_analysis(
     request: AnalyzeRequest,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    config: dict = Depends(get_config)
 ):
     """
     Start video analysis job
@@ -90,23 +128,27 @@ async def start_analysis(
     5. Creates thumbnails
     """
     # Verify video exists and belongs to user
-    video = db.query(Video).filter(
-        Video.id == request.video_id,
-        Video.user_id == current_user.id
-    ).first()
-    
-    if not video:
+    owns_video = (await db.execute(
+        select(exists().where(
+            Video.id == request.video_id,
+            Video.user_id == current_user.id
+        ))
+    )).scalar()
+    
+    if not owns_video:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Video not found"
         )
     
     # Check if analysis already in progress
-    existing_job = db.query(Job).filter(
-        Job.video_id == request.video_id,
-        Job.type == 'analyze',
-        Job.status.in_(['pending', 'processing'])
-    ).first()
+    existing_job = (await db.execute(
+        select(Job.id).where(
+            Job.video_id == request.video_id,
+            Job.type == 'analyze',
+            Job.status.in_(['pending', 'processing'])
+        ).limit(1)
+    )).scalar_one_or_none()
     
     if existing_job:
         raise HTTPException(
@@ -114,9 +156,6 @@ async def start_analysis(
             detail="Analysis already in progress for this video"
         )
     
-    # Load configuration
-    config = load_config()
-    
     # Merge with user-provided targets
     analysis_config = config['analysis'].copy()
     if request.targets:
@@ -128,28 +167,23 @@ async def start_analysis(
     analysis_config['whisper_model'] = config['whisper']['model']
     analysis_config['language'] = config['whisper'].get('language', 'auto')
     
-    # Create job record
-    job = Job(
-        video_id=request.video_id,
-        type='analyze',
-        status='pending',
-        progress=0,
-        logs={}
-    )
-    
-    db.add(job)
-    db.commit()
-    db.refresh(job)
+    # Create job record (RETURNING avoids a refresh round-trip)
+    job_id = (await db.execute(
+        insert(Job).values(
+            video_id=request.video_id,
+            type='analyze',
+            status='pending',
+            progress=0,
+            logs={}
+        ).returning(Job.id)
+    )).scalar_one()
+    await db.commit()
     
     # Start async task
-    analyze_video_task.delay(
-        job_id=str(job.id),
-        video_id=request.video_id,
-        config=analysis_config
-    )
+    await enqueue_analysis(job_id, request.video_id, analysis_config)
     
     return {
-        "job_id": str(job.id),
+        "job_id": job_id,
         "video_id": request.video_id,
         "status": "pending",
         "message": "Analysis job started. This typically takes 2-5 minutes."
@@ -158,136 +192,80 @@ async def start_analysis(
 
 @router.get("/jobs/{job_id}", response_model=JobStatus)
 async def get_job_status(
-    job_id: str,
+    job_id: UUID,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Get job status and progress
     
     Returns real-time status of analysis or render job
     """
-    job = db.query(Job).filter(Job.id == job_id).first()
-    
-    if not job:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Job not found"
-        )
-    
-    # Verify user owns the video
-    video = db.query(Video).filter(
-        Video.id == job.video_id,
-        Video.user_id == current_user.id
-    ).first()
-    
-    if not video:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Access denied"
+    job = await get_owned_job(
+        db, job_id, current_user.id,
+        load_only(
+            Job.id, Job.video_id, Job.type, Job.status,
+            Job.progress, Job.logs, Job.created_at
         )
+    )
     
-    return {
-        "job_id": str(job.id),
-        "video_id": str(job.video_id),
-        "type": job.type,
-        "status": job.status,
-        "progress": job.progress,
-        "logs": job.logs,
-        "created_at": job.created_at.isoformat()
-    }
+    return job
 
 
-@router.get("/jobs", response_model=List[JobStatus])
+@router.get("/jobs", response_model=JobPage)
 async def list_jobs(
-    video_id: Optional[str] = None,
+    video_id: Optional[UUID] = None,
     job_type: Optional[str] = None,
     status_filter: Optional[str] = None,
-    skip: int = 0,
-    limit: int = 20,
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
-    List jobs for current user
+    List jobs for current user, newest first
     
     - **video_id**: Filter by video ID
     - **job_type**: Filter by job type (analyze, render)
     - **status_filter**: Filter by status (pending, processing, completed, failed)
-    - **skip**: Pagination offset
+    - **cursor**: next_cursor from the previous page
     - **limit**: Max results
     """
-    # Get all video IDs for current user
-    user_video_ids = [str(v.id) for v in db.query(Video).filter(
+    # Build query (ownership enforced by joining through videos)
+    query = select(Job).join(Video, Video.id == Job.video_id).options(
+        contains_eager(Job.video)
+    ).where(
         Video.user_id == current_user.id
-    ).all()]
-    
-    if not user_video_ids:
-        return []
-    
-    # Build query
-    query = db.query(Job).filter(Job.video_id.in_(user_video_ids))
+    )
     
     # Apply filters
     if video_id:
-        query = query.filter(Job.video_id == video_id)
+        query = query.where(Job.video_id == video_id)
     
     if job_type:
-        query = query.filter(Job.type == job_type)
+        query = query.where(Job.type == job_type)
     
     if status_filter:
-        query = query.filter(Job.status == status_filter)
-    
-    # Order by most recent first
-    query = query.order_by(Job.created_at.desc())
-    
-    # Pagination
-    jobs = query.offset(skip).limit(limit).all()
-    
-    return [
-        {
-            "job_id": str(j.id),
-            "video_id": str(j.video_id),
-            "type": j.type,
-            "status": j.status,
-            "progress": j.progress,
-            "logs": j.logs,
-            "created_at": j.created_at.isoformat()
-        }
-        for j in jobs
-    ]
+        query = query.where(Job.status == status_filter)
+    
+    # Keyset pagination, most recent first
+    jobs = (await db.execute(keyset_paginate(query, Job, cursor, limit))).scalars().all()
+    
+    return keyset_page(jobs, limit)
 
 
 @router.delete("/jobs/{job_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def cancel_job(
-    job_id: str,
+    job_id: UUID,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Cancel a pending or processing job
     
     Note: Jobs that are already processing may not stop immediately
     """
-    job = db.query(Job).filter(Job.id == job_id).first()
-    
-    if not job:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Job not found"
-        )
-    
-    # Verify user owns the video
-    video = db.query(Video).filter(
-        Video.id == job.video_id,
-        Video.user_id == current_user.id
-    ).first()
-    
-    if not video:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Access denied"
-        )
+    job = await get_owned_job(db, job_id, current_user.id)
     
     # Only allow cancellation of pending/processing jobs
     if job.status not in ['pending', 'processing']:
@@ -299,7 +277,7 @@ async def cancel_job(
     # Update job status
     job.status = 'cancelled'
     job.logs = {**job.logs, 'cancelled_by': 'user', 'message': 'Job cancelled by user'}
-    db.commit()
+    await db.commit()
     
     # TODO: Send cancellation signal to Celery worker
     # from app.workers.celery_app import celery_app
@@ -310,34 +288,17 @@ async def cancel_job(
 
 @router.post("/jobs/{job_id}/retry", response_model=AnalyzeResponse)
 async def retry_job(
-    job_id: str,
+    job_id: UUID,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    config: dict = Depends(get_config)
 ):
     """
     Retry a failed job
     
     Creates a new job with the same parameters as the failed one
     """
-    original_job = db.query(Job).filter(Job.id == job_id).first()
-    
-    if not original_job:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Job not found"
-        )
-    
-    # Verify user owns the video
-    video = db.query(Video).filter(
-        Video.id == original_job.video_id,
-        Video.user_id == current_user.id
-    ).first()
-    
-    if not video:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Access denied"
-        )
+    original_job = await get_owned_job(db, job_id, current_user.id)
     
     # Only allow retry of failed jobs
     if original_job.status != 'failed':
@@ -347,32 +308,27 @@ async def retry_job(
         )
     
     # Create new job
-    new_job = Job(
-        video_id=original_job.video_id,
-        type=original_job.type,
-        status='pending',
-        progress=0,
-        logs={'retried_from': str(original_job.id)}
-    )
-    
-    db.add(new_job)
-    db.commit()
-    db.refresh(new_job)
+    new_job_id = (await db.execute(
+        insert(Job).values(
+            video_id=original_job.video_id,
+            type=original_job.type,
+            status='pending',
+            progress=0,
+            logs={'retried_from': str(original_job.id)}
+        ).returning(Job.id)
+    )).scalar_one()
+    await db.commit()
     
     # Extract config from original job logs
-    config = original_job.logs.get('config', load_config())
+    config = original_job.logs.get('config', config)
     
     # Start task based on type
     if original_job.type == 'analyze':
-        analyze_video_task.delay(
-            job_id=str(new_job.id),
-            video_id=str(original_job.video_id),
-            config=config
-        )
+        await enqueue_analysis(new_job_id, original_job.video_id, config)
     
     return {
-        "job_id": str(new_job.id),
-        "video_id": str(original_job.video_id),
+        "job_id": new_job_id,
+        "video_id": original_job.video_id,
         "status": "pending",
         "message": "Job retried"
     }
\ No newline at end of file
@@ -1,68 +1,149 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from pydantic import BaseModel
-from typing import List, Dict, Optional
-import yaml
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import UUID4, BaseModel, ConfigDict, Field, conlist, field_validator
+from typing import List, Dict, Literal, Optional
+from datetime import datetime
+from uuid import UUID
+from redis.exceptions import RedisError
+from celery import group
+import logging
 
+from app.config import OutputFormat, Template
 from app.database import get_db
 from app.models import User, Render, Candidate, Video
 from app.api.auth import get_current_user
-from app.workers.renderer import render_clips_task
+from app.services.redis_service import release_active_renders, reserve_active_renders
+from app.utils.pagination import keyset_page, keyset_paginate
+from app.workers.renderer import render_task
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+MAX_CONCURRENT = 3
+
 
 class RenderRequest(BaseModel):
-    candidate_ids: List[str]
-    template: str = "clean"  # clean, manga, impact, karaoke
-    outputs: List[str] = ["9:16"]  # 9:16, 1:1, 4:5
+    model_config = ConfigDict(extra='forbid')
+    
+    # Validated by pydantic before the handler runs; caps per-request fanout
+    candidate_ids: conlist(UUID4, min_length=1, max_length=50)
+    template: Template = "clean"
+    outputs: conlist(OutputFormat, min_length=1) = ["9:16"]
     watermark: Optional[str] = "@myanime"
     loudness: Optional[str] = "-14"
-    captions: Optional[str] = "on"  # on, off
+    captions: Literal['on', 'off'] = "on"
+    
+    @field_validator('candidate_ids')
+    @classmethod
+    def candidate_ids_unique(cls, candidate_ids: List[UUID]) -> List[UUID]:
+        # Each candidate is its own clip task; duplicates would render and upload to the same keys twice
+        if len(set(candidate_ids)) != len(candidate_ids):
+            raise ValueError("candidate_ids must not contain duplicates")
+        return candidate_ids
 
 
 class RenderResponse(BaseModel):
-    render_id: str
+    render_id: Optional[UUID]
     status: str
     message: str
 
 
 class RenderStatus(BaseModel):
-    render_id: str
+    # Read straight off Render rows; render_id maps to the Render.id attribute
+    model_config = ConfigDict(from_attributes=True, populate_by_name=True, extra='forbid')
+    
+    render_id: UUID = Field(validation_alias='id')
     status: str
     files: dict
-    created_at: str
-    
-    class Config:
-        from_attributes = True
+    created_at: datetime
+
+
+class RenderPage(BaseModel):
+    items: List[RenderStatus]
+    next_cursor: Optional[str]
+
+
+async def count_active_renders(db: AsyncSession, user_id) -> int:
+    """Count a user's pending/processing renders in the database"""
+    return (await db.execute(
+        select(func.count()).select_from(Render).where(
+            Render.user_id == user_id,
+            Render.status.in_(['pending', 'processing'])
+        )
+    )).scalar_one()
 
 
-def load_config():
-    """Load configuration from config.yaml"""
+async def reserve_render_slots(db: AsyncSession, user_id, count: int) -> bool:
+    """
+    Reserve slots against the concurrent render limit
+    
+    The count is mirrored in Redis and checked-and-incremented atomically.
+    On a cold key it is seeded from the database; if Redis is down the
+    database count is used directly.
+    """
     try:
-        with open('config.yaml', 'r') as f:
-            return yaml.safe_load(f)
-    except FileNotFoundError:
-        return {
-            'render': {
-                'templates': ['clean', 'manga', 'impact', 'karaoke'],
-                'default_template': 'clean',
-                'loudness_target': -14
-            }
-        }
+        reserved = await reserve_active_renders(user_id, count, MAX_CONCURRENT)
+        if reserved is None:
+            active = await count_active_renders(db, user_id)
+            reserved = await reserve_active_renders(user_id, count, MAX_CONCURRENT, seed=active)
+        return reserved
+    except RedisError as e:
+        logger.warning(f"Redis unavailable for render limit, using database: {e}")
+        return await count_active_renders(db, user_id) + count <= MAX_CONCURRENT
+
+
+async def _owned_candidate_ids(db: AsyncSession, user_id, candidate_ids: List[UUID]) -> set:
+    """Fetch which of the given candidates belong to the user's videos (single JOIN)"""
+    owned_ids = (await db.execute(
+        select(Candidate.id).join(Video, Video.id == Candidate.video_id).where(
+            Candidate.id.in_(candidate_ids),
+            Video.user_id == user_id
+        )
+    )).scalars().all()
+    
+    return set(owned_ids)
+
+
+def _check_candidates_owned(request: RenderRequest, owned_ids: set) -> None:
+    """Reject the request if any candidate is missing or not the user's"""
+    missing = set(request.candidate_ids) - owned_ids
+    if missing:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"One or more candidates not found: {', '.join(sorted(map(str, missing)))}"
+        )
+
+
+def _build_render_row(request: RenderRequest, user_id) -> dict:
+    """Column values for a new pending render"""
+    return {
+        'user_id': user_id,
+        'params': {
+            'candidate_ids': [str(cid) for cid in request.candidate_ids],
+            'template': request.template,
+            'outputs': request.outputs,
+            'watermark': request.watermark,
+            'loudness': request.loudness,
+            'captions': request.captions
+        },
+        'status': 'pending',
+        'files': {}
+    }
 
 
 @router.post("/renders", response_model=RenderResponse, status_code=status.HTTP_201_CREATED)
 async def create_render(
     request: RenderRequest,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Create a render job for selected candidate clips
     
     - **candidate_ids**: List of candidate IDs to render
-    - **template**: Caption template (clean, manga, impact, karaoke)
+    - **template**: Caption template (clean, manga, impact, karaoke, raw)
     - **outputs**: List of aspect ratios (9:16, 1:1, 4:5)
     - **watermark**: Watermark text (e.g., @username)
     - **loudness**: Target loudness in LUFS (default: -14)
@@ -74,93 +155,37 @@ async def create_render(
     - Audio normalization
     - Watermark overlay
     """
-    # Validate inputs
-    config = load_config()
-    
-    if not request.candidate_ids:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="At least one candidate must be selected"
-        )
-    
-    if request.template not in config['render']['templates']:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Invalid template. Must be one of: {', '.join(config['render']['templates'])}"
-        )
-    
-    valid_outputs = ['9:16', '1:1', '4:5']
-    for output in request.outputs:
-        if output not in valid_outputs:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Invalid output format. Must be one of: {', '.join(valid_outputs)}"
-            )
-    
     # Verify all candidates exist and belong to user's videos
-    candidates = db.query(Candidate).filter(
-        Candidate.id.in_(request.candidate_ids)
-    ).all()
-    
-    if len(candidates) != len(request.candidate_ids):
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="One or more candidates not found"
-        )
-    
-    # Verify ownership through video
-    for candidate in candidates:
-        video = db.query(Video).filter(
-            Video.id == candidate.video_id,
-            Video.user_id == current_user.id
-        ).first()
-        
-        if not video:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail=f"Access denied for candidate {candidate.id}"
-            )
+    owned_ids = await _owned_candidate_ids(db, current_user.id, request.candidate_ids)
+    _check_candidates_owned(request, owned_ids)
     
     # Check concurrent render limit
-    active_renders = db.query(Render).filter(
-        Render.user_id == current_user.id,
-        Render.status.in_(['pending', 'processing'])
-    ).count()
-    
-    MAX_CONCURRENT = 3
-    if active_renders >= MAX_CONCURRENT:
+    if not await reserve_render_slots(db, current_user.id, 1):
         raise HTTPException(
             status_code=status.HTTP_429_TOO_MANY_REQUESTS,
             detail=f"Maximum {MAX_CONCURRENT} concurrent renders allowed"
         )
     
-    # Create render record
-    render = Render(
-        user_id=current_user.id,
-        params={
-            'candidate_ids': request.candidate_ids,
-            'template': request.template,
-            'outputs': request.outputs,
-            'watermark': request.watermark,
-            'loudness': request.loudness,
-            'captions': request.captions
-        },
-        status='pending',
-        files={}
-    )
-    
-    db.add(render)
-    db.commit()
-    db.refresh(render)
+    # Create render record (RETURNING avoids a refresh round-trip)
+    row = _build_render_row(request, current_user.id)
     
-    # Start async render task
-    render_clips_task.delay(
-        render_id=str(render.id),
-        params=render.params
+    try:
+        render_id = (await db.execute(
+            insert(Render).values(**row).returning(Render.id)
+        )).scalar_one()
+        await db.commit()
+    except Exception:
+        await release_active_renders(current_user.id)
+        raise
+    
+    # Start async render task (task_id = render id)
+    render_task.apply_async(
+        kwargs={'render_id': str(render_id), 'params': row['params']},
+        task_id=str(render_id)
     )
     
     return {
-        "render_id": str(render.id),
+        "render_id": render_id,
         "status": "pending",
         "message": f"Render job started for {len(request.candidate_ids)} clips"
     }
@@ -168,9 +193,9 @@ async def create_render(
 
 @router.get("/renders/{render_id}", response_model=RenderStatus)
 async def get_render_status(
-    render_id: str,
+    render_id: UUID,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Get render job status and download URLs
@@ -179,10 +204,12 @@ async def get_render_status(
     - Job status (pending, processing, completed, failed)
     - Download URLs for completed renders (organized by candidate and format)
     """
-    render = db.query(Render).filter(
-        Render.id == render_id,
-        Render.user_id == current_user.id
-    ).first()
+    render = (await db.execute(
+        select(Render).where(
+            Render.id == render_id,
+            Render.user_id == current_user.id
+        )
+    )).scalar_one_or_none()
     
     if not render:
         raise HTTPException(
@@ -190,54 +217,39 @@ async def get_render_status(
             detail="Render not found"
         )
     
-    return {
-        "render_id": str(render.id),
-        "status": render.status,
-        "files": render.files,
-        "created_at": render.created_at.isoformat()
-    }
+    return render
 
 
-@router.get("/renders", response_model=List[RenderStatus])
+@router.get("/renders", response_model=RenderPage)
 async def list_renders(
     status_filter: Optional[str] = None,
-    skip: int = 0,
-    limit: int = 20,
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
-    List render jobs for current user
+    List render jobs for current user, newest first
     
     - **status_filter**: Filter by status (pending, processing, completed, failed)
-    - **skip**: Pagination offset
+    - **cursor**: next_cursor from the previous page
     - **limit**: Max results
     """
-    query = db.query(Render).filter(Render.user_id == current_user.id)
+    query = select(Render).where(Render.user_id == current_user.id)
     
     if status_filter:
-        query = query.filter(Render.status == status_filter)
+        query = query.where(Render.status == status_filter)
     
-    renders = query.order_by(
-        Render.created_at.desc()
-    ).offset(skip).limit(limit).all()
+    renders = (await db.execute(keyset_paginate(query, Render, cursor, limit))).scalars().all()
     
-    return [
-        {
-            "render_id": str(r.id),
-            "status": r.status,
-            "files": r.files,
-            "created_at": r.created_at.isoformat()
-        }
-        for r in renders
-    ]
+    return keyset_page(renders, limit)
 
 
 @router.delete("/renders/{render_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_render(
-    render_id: str,
+    render_id: UUID,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Delete a render record and associated files
@@ -245,10 +257,14 @@ async def delete_render(
     Note: This only deletes the database record and S3 files.
     Cannot cancel jobs that are already processing.
     """
-    render = db.query(Render).filter(
-        Render.id == render_id,
-        Render.user_id == current_user.id
-    ).first()
+    # Delete render record (ownership enforced by the WHERE clause)
+    render = (await db.execute(
+        delete(Render).where(
+            Render.id == render_id,
+            Render.user_id == current_user.id
+        ).returning(Render.id, Render.status, Render.files)
+    )).one_or_none()
+    await db.commit()
     
     if not render:
         raise HTTPException(
@@ -256,9 +272,8 @@ async def delete_render(
             detail="Render not found"
         )
     
-    # Delete render record
-    db.delete(render)
-    db.commit()
+    if render.status in ('pending', 'processing'):
+        await release_active_renders(current_user.id)
     
     # TODO: Delete files from S3
     # for candidate_files in render.files.values():
@@ -272,7 +287,7 @@ async def delete_render(
 async def batch_render(
     requests: List[RenderRequest],
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Create multiple render jobs at once
@@ -285,32 +300,63 @@ async def batch_render(
             detail="Maximum 5 batch renders allowed per request"
         )
     
-    # Check total concurrent limit
-    active_renders = db.query(Render).filter(
-        Render.user_id == current_user.id,
-        Render.status.in_(['pending', 'processing'])
-    ).count()
+    # Verify candidates for the whole batch in one query;
+    # requests with missing candidates are reported per item
+    errors = {}
+    owned_ids = await _owned_candidate_ids(
+        db, current_user.id, [cid for request in requests for cid in request.candidate_ids]
+    )
+    for index, request in enumerate(requests):
+        try:
+            _check_candidates_owned(request, owned_ids)
+        except HTTPException as e:
+            errors[index] = e.detail
     
-    MAX_CONCURRENT = 3
-    if active_renders + len(requests) > MAX_CONCURRENT:
+    valid = [index for index in range(len(requests)) if index not in errors]
+    
+    # Check total concurrent limit, reserving a slot per valid request
+    if valid and not await reserve_render_slots(db, current_user.id, len(valid)):
         raise HTTPException(
             status_code=status.HTTP_429_TOO_MANY_REQUESTS,
             detail=f"Would exceed maximum {MAX_CONCURRENT} concurrent renders"
         )
     
-    results = []
-    
-    for request in requests:
-        # Reuse create_render logic
+    # Insert all renders in one round-trip and commit once
+    render_ids = {}
+    if valid:
+        rows = [_build_render_row(requests[index], current_user.id) for index in valid]
         try:
-            result = await create_render(request, current_user, db)
-            results.append(result)
-        except HTTPException as e:
+            ids = (await db.execute(
+                insert(Render).returning(Render.id, sort_by_parameter_order=True),
+                rows
+            )).scalars().all()
+            await db.commit()
+        except Exception:
+            await release_active_renders(current_user.id, len(valid))
+            raise
+        
+        render_ids = dict(zip(valid, ids))
+        
+        # Start async render tasks, published together over one producer
+        group(
+            render_task.s(render_id=str(render_id), params=row['params']).set(task_id=str(render_id))
+            for render_id, row in zip(ids, rows)
+        ).apply_async()
+    
+    results = []
+    for index, request in enumerate(requests):
+        if index in errors:
             # Include error in results
             results.append({
                 "render_id": None,
                 "status": "error",
-                "message": e.detail
+                "message": errors[index]
+            })
+        else:
+            results.append({
+                "render_id": render_ids[index],
+                "status": "pending",
+                "message": f"Render job started for {len(request.candidate_ids)} clips"
             })
     
     return results
@@ -318,11 +364,11 @@ async def batch_render(
 
 @router.get("/renders/{render_id}/download/{candidate_id}/{format}")
 async def download_render(
-    render_id: str,
+    render_id: UUID,
     candidate_id: str,
     format: str,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Get a signed download URL for a specific rendered clip
@@ -333,10 +379,12 @@ async def download_render(
     
     Returns a signed URL valid for 24 hours
     """
-    render = db.query(Render).filter(
-        Render.id == render_id,
-        Render.user_id == current_user.id
-    ).first()
+    render = (await db.execute(
+        select(Render).where(
+            Render.id == render_id,
+            Render.user_id == current_user.id
+        )
+    )).scalar_one_or_none()
     
     if not render:
         raise HTTPException(
@@ -1,16 +1,45 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from pydantic import BaseModel
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import delete, exists, func, insert, lambda_stmt, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import load_only
+from pydantic import BaseModel, ConfigDict, Field
+from botocore.exceptions import ClientError
 from typing import List, Optional
+from datetime import datetime
+from types import MappingProxyType
+from uuid import UUID
+import math
 import uuid
 
 from app.database import get_db
 from app.models import User, Video, Candidate
 from app.api.auth import get_current_user
-from app.services.s3_service import generate_signed_upload_url
+from app.services.s3_service import (
+    complete_multipart_upload_async,
+    create_multipart_upload_async,
+    generate_signed_upload_url_async,
+)
+from app.services.redis_service import cached_json, invalidate_video_cache, video_cache_key
+from app.utils.pagination import keyset_page, keyset_paginate
 
 router = APIRouter()
 
+# Upload limits, built once at import
+MAX_UPLOAD_SIZE = 2 * 1024 * 1024 * 1024  # 2GB
+UPLOAD_EXTENSIONS = MappingProxyType({
+    'video/mp4': 'mp4',
+    'video/x-matroska': 'mkv',
+    'video/avi': 'avi',
+    'video/quicktime': 'mov',
+    'video/x-msvideo': 'avi'
+})
+ALLOWED_UPLOAD_TYPES = frozenset(UPLOAD_EXTENSIONS)
+_SIZE_ERROR = f"File size exceeds maximum of {MAX_UPLOAD_SIZE / 1024 / 1024 / 1024}GB"
+# Larger uploads go to S3 as parallel multipart parts
+MULTIPART_THRESHOLD = 100 * 1024 * 1024  # 100MB
+MULTIPART_PART_SIZE = 16 * 1024 * 1024  # 16MB
+_CONTENT_TYPE_ERROR = f"Unsupported content type. Allowed: {', '.join(UPLOAD_EXTENSIONS)}"
+
 
 class UploadInit(BaseModel):
     filename: str
@@ -19,9 +48,25 @@ class UploadInit(BaseModel):
 
 
 class UploadInitResponse(BaseModel):
-    upload_url: str
+    upload_url: Optional[str] = None  # Single PUT uploads
     upload_id: str
     expires_in: int
+    # Multipart uploads: PUT part i to part_urls[i - 1], then call /uploads/complete
+    multipart_upload_id: Optional[str] = None
+    part_urls: Optional[List[str]] = None
+    part_size: Optional[int] = None
+
+
+class UploadPart(BaseModel):
+    part_number: int = Field(ge=1, le=10000)
+    etag: str
+
+
+class UploadComplete(BaseModel):
+    upload_id: str
+    multipart_upload_id: str
+    content_type: str = "video/mp4"
+    parts: List[UploadPart] = Field(min_length=1)
 
 
 class VideoCreate(BaseModel):
@@ -31,39 +76,44 @@ class VideoCreate(BaseModel):
 
 
 class VideoResponse(BaseModel):
-    video_id: str
+    # Read straight off Video rows; video_id maps to the Video.id attribute
+    model_config = ConfigDict(from_attributes=True, populate_by_name=True)
+    
+    video_id: UUID = Field(validation_alias='id')
     title: Optional[str]
     duration: Optional[float]
     resolution: Optional[str]
-    created_at: str
-    
-    class Config:
-        from_attributes = True
+    created_at: datetime
 
 
 class CandidateResponse(BaseModel):
-    id: str
+    model_config = ConfigDict(from_attributes=True)
+    
+    id: UUID
     start_s: float
     end_s: float
     score: float
     features: dict
     thumb_url: Optional[str]
-    
-    class Config:
-        from_attributes = True
+
+
+class VideoPage(BaseModel):
+    items: List[VideoResponse]
+    next_cursor: Optional[str]
 
 
 class CandidatesListResponse(BaseModel):
-    video_id: str
-    total: int
+    video_id: UUID
+    total: Optional[int] = None  # Matching candidates; None on cursor pages
     candidates: List[CandidateResponse]
+    next_cursor: Optional[str] = None
 
 
 @router.post("/uploads/init", response_model=UploadInitResponse)
 async def initialize_upload(
     upload_data: UploadInit,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Initialize video upload and get signed S3 URL
@@ -72,45 +122,51 @@ async def initialize_upload(
     - **filesize**: File size in bytes (max 2GB)
     - **content_type**: MIME type (e.g., video/mp4)
     
-    Returns a signed URL for direct upload to S3
+    Returns a signed URL for direct upload to S3. Files over 100MB get
+    one signed URL per 16MB part instead; finish with /uploads/complete.
     """
     # Validate file size (2GB max)
-    MAX_SIZE = 2 * 1024 * 1024 * 1024  # 2GB
-    if upload_data.filesize > MAX_SIZE:
+    if upload_data.filesize > MAX_UPLOAD_SIZE:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"File size exceeds maximum of {MAX_SIZE / 1024 / 1024 / 1024}GB"
+            detail=_SIZE_ERROR
         )
     
     # Validate content type
-    allowed_types = [
-        'video/mp4', 'video/x-matroska', 'video/avi', 
-        'video/quicktime', 'video/x-msvideo'
-    ]
-    if upload_data.content_type not in allowed_types:
+    if upload_data.content_type not in ALLOWED_UPLOAD_TYPES:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Unsupported content type. Allowed: {', '.join(allowed_types)}"
+            detail=_CONTENT_TYPE_ERROR
         )
     
     # Generate unique upload ID
     upload_id = str(uuid.uuid4())
     
     # Generate file extension
-    ext_map = {
-        'video/mp4': 'mp4',
-        'video/x-matroska': 'mkv',
-        'video/avi': 'avi',
-        'video/quicktime': 'mov',
-        'video/x-msvideo': 'avi'
-    }
-    ext = ext_map.get(upload_data.content_type, 'mp4')
+    ext = UPLOAD_EXTENSIONS[upload_data.content_type]
     
     # Generate S3 key
     s3_key = f"uploads/{current_user.id}/{upload_id}.{ext}"
     
+    # Large files: multipart upload with one signed URL per part
+    if upload_data.filesize > MULTIPART_THRESHOLD:
+        part_count = math.ceil(upload_data.filesize / MULTIPART_PART_SIZE)
+        mpu_id, part_urls = await create_multipart_upload_async(
+            s3_key,
+            part_count,
+            content_type=upload_data.content_type,
+            expires_in=3600  # 1 hour
+        )
+        return {
+            "upload_id": upload_id,
+            "expires_in": 3600,
+            "multipart_upload_id": mpu_id,
+            "part_urls": part_urls,
+            "part_size": MULTIPART_PART_SIZE
+        }
+    
     # Generate signed URL
-    signed_url = generate_signed_upload_url(
+    signed_url = await generate_signed_upload_url_async(
         s3_key,
         content_type=upload_data.content_type,
         expires_in=3600  # 1 hour
@@ -123,11 +179,46 @@ async def initialize_upload(
     }
 
 
+@router.post("/uploads/complete", status_code=status.HTTP_204_NO_CONTENT)
+async def complete_upload(
+    complete_data: UploadComplete,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Finish a multipart upload started by /uploads/init
+    
+    - **upload_id**: ID returned from /uploads/init
+    - **multipart_upload_id**: Multipart upload ID returned from /uploads/init
+    - **content_type**: MIME type used in /uploads/init
+    - **parts**: Part number and ETag of every uploaded part
+    """
+    if complete_data.content_type not in ALLOWED_UPLOAD_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=_CONTENT_TYPE_ERROR
+        )
+    
+    ext = UPLOAD_EXTENSIONS[complete_data.content_type]
+    s3_key = f"uploads/{current_user.id}/{complete_data.upload_id}.{ext}"
+    
+    try:
+        await complete_multipart_upload_async(
+            s3_key,
+            complete_data.multipart_upload_id,
+            [{"PartNumber": p.part_number, "ETag": p.etag} for p in complete_data.parts]
+        )
+    except ClientError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Could not complete upload"
+        )
+
+
 @router.post("/videos", response_model=VideoResponse, status_code=status.HTTP_201_CREATED)
 async def create_video(
     video_data: VideoCreate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Create video record after successful upload
@@ -142,95 +233,81 @@ async def create_video(
     # In production, verify the upload actually succeeded
     s3_url = f"s3://anime-clips/uploads/{current_user.id}/{video_data.upload_id}.mp4"
     
-    # Create video record
-    new_video = Video(
-        user_id=current_user.id,
-        title=video_data.title or f"Video {video_data.upload_id[:8]}",
-        src_url=s3_url,
-        duration=None,  # Will be populated during analysis
-        resolution=None  # Will be populated during analysis
-    )
-    
-    db.add(new_video)
-    db.commit()
-    db.refresh(new_video)
-    
-    return {
-        "video_id": str(new_video.id),
-        "title": new_video.title,
-        "duration": new_video.duration,
-        "resolution": new_video.resolution,
-        "created_at": new_video.created_at.isoformat()
-    }
+    # Create video record, reading generated id/created_at back via RETURNING
+    # (duration and resolution are populated during analysis)
+    new_video = (await db.execute(
+        insert(Video).values(
+            user_id=current_user.id,
+            title=video_data.title or f"Video {video_data.upload_id[:8]}",
+            src_url=s3_url
+        ).returning(Video.id, Video.title, Video.duration, Video.resolution, Video.created_at)
+    )).one()
+    await db.commit()
+    
+    return new_video
 
 
 @router.get("/videos/{video_id}", response_model=VideoResponse)
 async def get_video(
-    video_id: str,
+    video_id: UUID,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Get video details by ID
     
     Returns video metadata including duration and resolution
     """
-    video = db.query(Video).filter(
-        Video.id == video_id,
-        Video.user_id == current_user.id
-    ).first()
-    
-    if not video:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Video not found"
-        )
-    
-    return {
-        "video_id": str(video.id),
-        "title": video.title,
-        "duration": video.duration,
-        "resolution": video.resolution,
-        "created_at": video.created_at.isoformat()
-    }
+    user_id = current_user.id
+    
+    async def load_video():
+        video = (await db.execute(lambda_stmt(
+            lambda: select(Video).where(
+                Video.id == video_id,
+                Video.user_id == user_id
+            )
+        ))).scalar_one_or_none()
+        
+        if not video:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Video not found"
+            )
+        
+        return VideoResponse.model_validate(video).model_dump(mode="json")
+    
+    # Cached briefly; the analyzer and delete_video invalidate it
+    return await cached_json(video_cache_key(user_id, video_id), load_video)
 
 
-@router.get("/videos", response_model=List[VideoResponse])
+@router.get("/videos", response_model=VideoPage)
 async def list_videos(
-    skip: int = 0,
-    limit: int = 20,
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
-    List all videos for current user
+    List all videos for current user, newest first
     
-    - **skip**: Number of records to skip (pagination)
+    - **cursor**: next_cursor from the previous page
     - **limit**: Maximum number of records to return
     """
-    videos = db.query(Video).filter(
-        Video.user_id == current_user.id
-    ).order_by(
-        Video.created_at.desc()
-    ).offset(skip).limit(limit).all()
-    
-    return [
-        {
-            "video_id": str(v.id),
-            "title": v.title,
-            "duration": v.duration,
-            "resolution": v.resolution,
-            "created_at": v.created_at.isoformat()
-        }
-        for v in videos
-    ]
+    # Only the columns VideoResponse needs, all held by the covering index
+    user_id = current_user.id
+    query = lambda_stmt(lambda: select(Video).options(
+        load_only(Video.id, Video.title, Video.duration, Video.resolution, Video.created_at)
+    ).where(Video.user_id == user_id))
+    videos = (await db.execute(keyset_paginate(query, Video, cursor, limit))).scalars().all()
+    
+    return keyset_page(videos, limit)
 
 
 @router.delete("/videos/{video_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_video(
-    video_id: str,
+    video_id: UUID,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Delete a video and all associated data
@@ -242,10 +319,15 @@ async def delete_video(
     - Jobs
     - Associated files in S3
     """
-    video = db.query(Video).filter(
-        Video.id == video_id,
-        Video.user_id == current_user.id
-    ).first()
+    # Delete in one statement; the ON DELETE CASCADE foreign keys remove
+    # jobs, transcripts and candidates
+    video = (await db.execute(
+        delete(Video).where(
+            Video.id == video_id,
+            Video.user_id == current_user.id
+        ).returning(Video.id, Video.src_url)
+    )).first()
+    await db.commit()
     
     if not video:
         raise HTTPException(
@@ -253,9 +335,7 @@ async def delete_video(
             detail="Video not found"
         )
     
-    # Delete video (cascade will handle related records)
-    db.delete(video)
-    db.commit()
+    await invalidate_video_cache(current_user.id, video_id)
     
     # TODO: Also delete files from S3
     # delete_from_s3(video.src_url)
@@ -265,11 +345,13 @@ async def delete_video(
 
 @router.get("/videos/{video_id}/candidates", response_model=CandidatesListResponse)
 async def get_video_candidates(
-    video_id: str,
+    video_id: UUID,
     min_score: Optional[float] = None,
     sort_by: str = "score",  # score, duration, start
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=100),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Get candidate clips for a video
@@ -277,50 +359,89 @@ async def get_video_candidates(
     - **video_id**: Video ID
     - **min_score**: Optional minimum score filter (0.0-1.0)
     - **sort_by**: Sort order (score, duration, start)
+    - **cursor**: next_cursor from the previous page (score sort only)
+    - **limit**: Page size; all candidates are returned if omitted (score sort only)
     
-    Returns list of candidate clips with scores and thumbnails
+    Returns list of candidate clips with scores and thumbnails; total counts
+    every match and is null on pages fetched with a cursor
     """
-    # Verify video ownership
-    video = db.query(Video).filter(
-        Video.id == video_id,
-        Video.user_id == current_user.id
-    ).first()
-    
-    if not video:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Video not found"
+    user_id = current_user.id
+    
+    async def load_candidates():
+        # Query candidates (ownership enforced by joining through videos)
+        # (built as a lambda statement so the SQL is compiled once per variant)
+        query = lambda_stmt(
+            lambda: select(Candidate).join(Video, Video.id == Candidate.video_id).where(
+                Video.id == video_id,
+                Video.user_id == user_id
+            )
         )
-    
-    # Query candidates
-    query = db.query(Candidate).filter(Candidate.video_id == video_id)
-    
-    # Apply filters
-    if min_score is not None:
-        query = query.filter(Candidate.score >= min_score)
-    
-    # Apply sorting
-    if sort_by == "score":
-        query = query.order_by(Candidate.score.desc())
-    elif sort_by == "duration":
-        query = query.order_by((Candidate.end_s - Candidate.start_s).desc())
-    elif sort_by == "start":
-        query = query.order_by(Candidate.start_s.asc())
-    
-    candidates = query.all()
-    
-    return {
-        "video_id": video_id,
-        "total": len(candidates),
-        "candidates": [
-            {
-                "id": str(c.id),
-                "start_s": c.start_s,
-                "end_s": c.end_s,
-                "score": c.score,
-                "features": c.features,
-                "thumb_url": c.thumb_url
-            }
-            for c in candidates
-        ]
-    }
\ No newline at end of file
+        
+        # Apply filters
+        if min_score is not None:
+            query += lambda s: s.where(Candidate.score >= min_score)
+        
+        # Apply sorting (score sort pages by (score, id) keyset when limit is set)
+        paged = sort_by == "score" and limit is not None
+        if paged:
+            query = keyset_paginate(query, Candidate, cursor, limit, sort_column=Candidate.score)
+        elif sort_by == "score":
+            query += lambda s: s.order_by(Candidate.score.desc())
+        elif sort_by == "duration":
+            query += lambda s: s.order_by(Candidate.duration_s.desc())
+        elif sort_by == "start":
+            query += lambda s: s.order_by(Candidate.start_s.asc())
+        
+        candidates = (await db.execute(query)).scalars().all()
+        
+        # Count on the first page only, in its own query so the page stays a
+        # top-N index scan; a count from the cursor onward would change per page
+        if not paged:
+            total = len(candidates)
+        elif cursor is None:
+            count_query = select(func.count()).select_from(Candidate).join(
+                Video, Video.id == Candidate.video_id
+            ).where(
+                Video.id == video_id,
+                Video.user_id == user_id
+            )
+            if min_score is not None:
+                count_query = count_query.where(Candidate.score >= min_score)
+            total = (await db.execute(count_query)).scalar()
+        else:
+            total = None
+        
+        # No rows: tell a missing/foreign video apart from one without candidates
+        if not candidates:
+            owns_video = (await db.execute(
+                select(exists().where(
+                    Video.id == video_id,
+                    Video.user_id == user_id
+                ))
+            )).scalar()
+        
+            if not owns_video:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Video not found"
+                )
+        
+        next_cursor = None
+        if paged:
+            page = keyset_page(candidates, limit, sort_key="score")
+            candidates, next_cursor = page["items"], page["next_cursor"]
+        
+        return {
+            "video_id": str(video_id),
+            "total": total,
+            "candidates": [CandidateResponse.model_validate(c).model_dump(mode="json") for c in candidates],
+            "next_cursor": next_cursor
+        }
+        
+    # One hash per video holds every filter/sort/page variant, so a single
+    # DELETE drops them all when analysis re-runs
+    return await cached_json(
+        f"{video_cache_key(user_id, video_id)}:candidates",
+        load_candidates,
+        field=f"{min_score}:{sort_by}:{cursor}:{limit}"
+    )
\ No newline at end of file
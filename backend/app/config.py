@@ -0,0 +1,59 @@
+from fastapi import Request
+from typing import Literal, get_args
+import copy
+import os
+
+from app.utils.yaml_cache import load_yaml_cached
+
+# Path to config.yaml (relative to the working directory by default)
+CONFIG_PATH = os.getenv("CONFIG_PATH", "config.yaml")
+
+# Caption templates and output aspect ratios the renderer supports ('raw' cuts
+# the clip without captions or effects)
+Template = Literal['clean', 'manga', 'impact', 'karaoke', 'raw']
+OutputFormat = Literal['9:16', '1:1', '4:5']
+
+VALID_TEMPLATES = frozenset(get_args(Template))
+VALID_OUTPUTS = frozenset(get_args(OutputFormat))
+
+# Fallback configuration used when config.yaml is missing
+DEFAULT_CONFIG = {
+    'analysis': {
+        'clip_min_s': 7,
+        'clip_max_s': 15,
+        'target_s': 10,
+        'candidates_per_minute': 4,
+        'max_candidates': 20
+    },
+    'scoring': {
+        'weights': {
+            'speech_hook': 0.30,
+            'motion': 0.25,
+            'audio_peak': 0.20,
+            'keyword_match': 0.15,
+            'scene_freshness': 0.10
+        }
+    },
+    'whisper': {
+        'model': 'base',
+        'language': 'auto'
+    },
+    'render': {
+        'templates': list(get_args(Template)),
+        'default_template': 'clean',
+        'loudness_target': -14
+    }
+}
+
+
+def load_config() -> dict:
+    """Load configuration from config.yaml, falling back to defaults"""
+    try:
+        return load_yaml_cached(CONFIG_PATH)
+    except FileNotFoundError:
+        return copy.deepcopy(DEFAULT_CONFIG)
+
+
+def get_config(request: Request) -> dict:
+    """Dependency returning the configuration loaded at app startup"""
+    return request.app.state.config
@@ -1,6 +1,9 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+from typing import AsyncIterator
 import os
 
 # Database URL from environment
@@ -9,13 +12,28 @@ DATABASE_URL = os.getenv(
     "postgresql://clipper:clipper_dev_password@db:5432/anime_clipper"
 )
 
-# Create engine
+# Pool settings. Each API request holds at most one session (get_db), so
+# DB_POOL_SIZE caps concurrent DB work per process; size it so that
+# processes * DB_POOL_SIZE stays under Postgres' max_connections.
+# Behind PgBouncer, let it do the pooling and open connections per use.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "25"))
+PGBOUNCER = os.getenv("PGBOUNCER", "").lower() in ("1", "true", "yes")
+
+if PGBOUNCER:
+    pool_kwargs = {"poolclass": NullPool}
+else:
+    pool_kwargs = {
+        "pool_use_lifo": True,  # Reuse warm connections; idle ones age out
+        "pool_recycle": 1800,
+    }
+
+# Sync engine for Celery workers and migrations
 engine = create_engine(
     DATABASE_URL,
     pool_pre_ping=True,  # Enable connection health checks
-    pool_size=10,  # Connection pool size
-    max_overflow=20,  # Max overflow connections
-    echo=False  # Set to True for SQL query logging
+    echo=False,  # Set to True for SQL query logging
+    **pool_kwargs,
+    **({} if PGBOUNCER else {"pool_size": 10, "max_overflow": 20})
 )
 
 # Create session factory
@@ -25,25 +43,44 @@ SessionLocal = sessionmaker(
     bind=engine
 )
 
+# Async engine (asyncpg) for API request handlers
+ASYNC_DATABASE_URL = DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1)
+
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_pre_ping=True,
+    echo=False,
+    **pool_kwargs,
+    **(
+        # PgBouncer transaction pooling can't keep prepared statements
+        {"connect_args": {"statement_cache_size": 0, "prepared_statement_cache_size": 0}}
+        if PGBOUNCER else {"pool_size": DB_POOL_SIZE, "max_overflow": 0}
+    )
+)
+
+# Async session factory
+AsyncSessionLocal = async_sessionmaker(
+    async_engine,
+    expire_on_commit=False,
+    autoflush=False
+)
+
 # Base class for models
 Base = declarative_base()
 
 
-def get_db():
+async def get_db() -> AsyncIterator[AsyncSession]:
     """
-    Dependency for FastAPI routes to get database session
+    Dependency for FastAPI routes to get an AsyncSession
     
     Usage:
         @app.get("/items")
-        def read_items(db: Session = Depends(get_db)):
-            items = db.query(Item).all()
-            return items
+        async def read_items(db: AsyncSession = Depends(get_db)):
+            result = await db.execute(select(Item))
+            return result.scalars().all()
     """
-    db = SessionLocal()
-    try:
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
 def init_db():
@@ -1,20 +1,78 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+import asyncio
+import logging
 import os
 
-from app.database import engine, get_db
+from app.config import load_config
+from app.database import async_engine, get_db
+from app.migrations import (
+    MIGRATION_MODE, get_migration_revisions, run_migrations, run_migrations_in_background
+)
 from app.models import Base
+from app.services.s3_service import (
+    S3_SKIP_BUCKET_CHECK, close_async_s3_client, ensure_bucket_async, open_async_s3_client
+)
 from app.api import auth, videos, jobs, renders
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+logger = logging.getLogger(__name__)
+
+# Set to 1 to create missing tables at startup (docker-compose dev setup)
+AUTO_CREATE_TABLES = os.getenv("AUTO_CREATE_TABLES") == "1"
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Load config.yaml once at startup and serve it from memory"""
+    config = load_config()
+    app.state.config = config
+    
+    # Shared pool for blocking calls offloaded with asyncio.to_thread
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4), thread_name_prefix="io")
+    )
+    
+    # Long-lived async S3 client for request handlers
+    await open_async_s3_client()
+    
+    # Make sure the upload bucket exists (non-fatal; uploads will surface errors)
+    if not S3_SKIP_BUCKET_CHECK:
+        try:
+            await ensure_bucket_async()
+        except Exception as e:
+            logger.warning(f"Could not ensure bucket exists: {e}")
+    
+    # Create tables for local dev (production schema is managed by Alembic)
+    if AUTO_CREATE_TABLES and MIGRATION_MODE == "off":
+        async with async_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+    
+    # Apply migrations without blocking the event loop
+    app.state.migration_status = "disabled"
+    if MIGRATION_MODE == "sync":
+        await asyncio.to_thread(run_migrations)
+        app.state.migration_status = "complete"
+    elif MIGRATION_MODE == "async":
+        app.state.migration_task = asyncio.create_task(run_migrations_in_background(app))
+    
+    yield
+    
+    await close_async_s3_client()
+    await async_engine.dispose()
+
 
 app = FastAPI(
     title="Anime Auto-Clipper API",
     description="Auto-generate viral-ready anime clips for TikTok/IG",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 # CORS middleware
@@ -43,14 +101,33 @@ async def root():
 
 
 @app.get("/health")
-async def health_check(db: Session = Depends(get_db)):
+async def health_check(db: AsyncSession = Depends(get_db)):
     """Health check endpoint"""
     try:
         # Test database connection
-        db.execute("SELECT 1")
+        await db.execute(text("SELECT 1"))
         return {"status": "healthy", "database": "connected"}
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail=f"Database connection failed: {str(e)}"
         )
+
+
+@app.get("/health/migrations")
+async def migration_health():
+    """Report the database's Alembic revision against the latest head"""
+    try:
+        revisions = await asyncio.to_thread(get_migration_revisions)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Could not read migration state: {str(e)}"
+        )
+    
+    return {
+        "mode": MIGRATION_MODE,
+        "status": app.state.migration_status,
+        **revisions,
+        "up_to_date": revisions["current"] == revisions["head"]
+    }
@@ -0,0 +1,62 @@
+from alembic import command
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from fastapi import FastAPI
+from pathlib import Path
+import asyncio
+import logging
+import os
+
+from app.database import DATABASE_URL, engine
+
+logger = logging.getLogger(__name__)
+
+# How the API applies Alembic migrations at startup:
+#   off   - don't run them (default; run `alembic upgrade head` at deploy)
+#   sync  - run before serving requests
+#   async - run in a background thread; the app is ready immediately
+#
+# Data migrations on large JSONB columns (jobs.logs, renders.files) should
+# not be one big UPDATE. Loop over batches inside the migration instead:
+#   SET lock_timeout = '5s';
+#   UPDATE ... WHERE id IN (SELECT id ... WHERE <not migrated> LIMIT 1000);
+# committing after each batch until no rows are updated.
+MIGRATION_MODE = os.getenv("MIGRATION_MODE", "off")
+
+ALEMBIC_INI = Path(__file__).resolve().parent.parent / "alembic.ini"
+
+
+def alembic_config() -> Config:
+    """Alembic config pointed at this app's database"""
+    config = Config(str(ALEMBIC_INI))
+    config.set_main_option("script_location", str(ALEMBIC_INI.parent / "alembic"))
+    config.set_main_option("sqlalchemy.url", DATABASE_URL.replace("%", "%%"))
+    # Keep uvicorn's logging config intact
+    config.attributes["configure_logger"] = False
+    return config
+
+
+def run_migrations():
+    """Upgrade the database to the latest revision"""
+    command.upgrade(alembic_config(), "head")
+
+
+async def run_migrations_in_background(app: FastAPI):
+    """Run migrations off the event loop, recording the outcome on app.state"""
+    app.state.migration_status = "running"
+    try:
+        await asyncio.to_thread(run_migrations)
+        app.state.migration_status = "complete"
+    except Exception:
+        logger.exception("Background migration failed")
+        app.state.migration_status = "failed"
+
+
+def get_migration_revisions() -> dict:
+    """Current database revision and the latest revision in the scripts"""
+    head = ScriptDirectory.from_config(alembic_config()).get_current_head()
+    with engine.connect() as connection:
+        current = MigrationContext.configure(connection).get_current_revision()
+
+    return {"current": current, "head": head}
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Float, Integer, ForeignKey, DateTime, Text
+from sqlalchemy import Column, String, Float, Integer, ForeignKey, DateTime, Text, Index, Computed, text
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -23,7 +23,7 @@ class Video(Base):
     __tablename__ = "videos"
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False, index=True)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     title = Column(String(500))
     src_url = Column(Text, nullable=False)
     duration = Column(Float)
@@ -31,30 +31,42 @@ class Video(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     user = relationship("User", back_populates="videos")
-    jobs = relationship("Job", back_populates="video")
-    transcripts = relationship("Transcript", back_populates="video")
-    candidates = relationship("Candidate", back_populates="video")
+    jobs = relationship("Job", back_populates="video", passive_deletes=True)
+    transcripts = relationship("Transcript", back_populates="video", passive_deletes=True)
+    candidates = relationship("Candidate", back_populates="video", passive_deletes=True)
+    
+    __table_args__ = (
+        Index(
+            'ix_videos_user_created_covering', 'user_id', text('created_at DESC'), text('id DESC'),
+            postgresql_include=['title', 'duration', 'resolution']
+        ),
+    )
 
 
 class Job(Base):
     __tablename__ = "jobs"
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    video_id = Column(UUID(as_uuid=True), ForeignKey("videos.id"), nullable=False, index=True)
+    video_id = Column(UUID(as_uuid=True), ForeignKey("videos.id", ondelete="CASCADE"), nullable=False)
     type = Column(String(50), nullable=False)  # 'analyze' or 'render'
     status = Column(String(50), default='pending', index=True)  # pending, processing, completed, failed
     progress = Column(Integer, default=0)
-    logs = Column(JSONB, default={})
+    logs = Column(JSONB, default=dict, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     video = relationship("Video", back_populates="jobs")
+    
+    __table_args__ = (
+        Index('ix_jobs_video_id_created_at', 'video_id', text('created_at DESC')),
+        Index('ix_jobs_video_type_status', 'video_id', 'type', 'status'),
+    )
 
 
 class Transcript(Base):
     __tablename__ = "transcripts"
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    video_id = Column(UUID(as_uuid=True), ForeignKey("videos.id"), nullable=False, index=True)
+    video_id = Column(UUID(as_uuid=True), ForeignKey("videos.id", ondelete="CASCADE"), nullable=False, index=True)
     lang = Column(String(10))
     words = Column(JSONB, nullable=False)  # Array of {word, start, end, confidence}
     
@@ -65,24 +77,39 @@ class Candidate(Base):
     __tablename__ = "candidates"
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    video_id = Column(UUID(as_uuid=True), ForeignKey("videos.id"), nullable=False, index=True)
+    video_id = Column(UUID(as_uuid=True), ForeignKey("videos.id", ondelete="CASCADE"), nullable=False)
     start_s = Column(Float, nullable=False)
     end_s = Column(Float, nullable=False)
+    duration_s = Column(Float, Computed("end_s - start_s", persisted=True))
     score = Column(Float, nullable=False, index=True)
-    features = Column(JSONB, default={})  # Detailed scoring breakdown
+    features = Column(JSONB, default=dict, nullable=False)  # Detailed scoring breakdown
     thumb_url = Column(Text)
     
     video = relationship("Video", back_populates="candidates")
+    
+    __table_args__ = (
+        Index('ix_candidates_video_score', 'video_id', text('score DESC'), text('id DESC')),
+        Index('ix_candidates_video_duration', 'video_id', text('duration_s DESC')),
+    )
 
 
 class Render(Base):
     __tablename__ = "renders"
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False, index=True)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
     params = Column(JSONB, nullable=False)  # candidate_ids, template, outputs, etc.
     status = Column(String(50), default='pending', index=True)
-    files = Column(JSONB, default={})  # Output URLs by format
+    files = Column(JSONB, default=dict, nullable=False)  # Output URLs by format
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     user = relationship("User", back_populates="renders")
+    
+    __table_args__ = (
+        Index('ix_renders_user_status', 'user_id', 'status'),
+        Index('ix_renders_user_created', 'user_id', text('created_at DESC')),
+        Index(
+            'ix_renders_user_active', 'user_id',
+            postgresql_where=text("status IN ('pending', 'processing')")
+        ),
+    )
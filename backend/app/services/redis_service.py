@@ -0,0 +1,185 @@
+import redis
+import redis.asyncio as aioredis
+from redis.exceptions import RedisError
+import orjson
+import os
+from typing import Any, Awaitable, Callable, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Redis Configuration
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+ACTIVE_RENDERS_TTL = 3600  # Counter self-heals from the database after an hour
+VIDEO_CACHE_TTL = 60  # Video metadata and candidate listings
+TRANSCRIPT_CACHE_TTL = 30 * 86400  # Whisper output by audio content hash
+
+# Async client for API handlers, sync client for Celery workers
+redis_client = aioredis.from_url(REDIS_URL, decode_responses=True)
+sync_redis_client = redis.from_url(REDIS_URL, decode_responses=True)
+
+# Atomically check the counter against the limit and reserve slots.
+# KEYS[1] = counter key, ARGV = count, limit, ttl, [seed]
+# Returns -1 if the counter is missing and no seed was given, -2 if over the limit.
+_RESERVE_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+if not current then
+    if ARGV[4] == nil then
+        return -1
+    end
+    current = ARGV[4]
+    redis.call('SET', KEYS[1], current, 'EX', ARGV[3])
+end
+if tonumber(current) + tonumber(ARGV[1]) > tonumber(ARGV[2]) then
+    return -2
+end
+local value = redis.call('INCRBY', KEYS[1], ARGV[1])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return value
+"""
+
+# Release slots; drop the key if it would go negative so the next check re-seeds
+_RELEASE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return -1
+end
+local value = redis.call('DECRBY', KEYS[1], ARGV[1])
+if value <= 0 then
+    redis.call('DEL', KEYS[1])
+end
+return value
+"""
+
+
+def active_renders_key(user_id) -> str:
+    """Redis key holding a user's pending/processing render count"""
+    return f"active_renders:{user_id}"
+
+
+async def reserve_active_renders(
+    user_id,
+    count: int,
+    limit: int,
+    seed: Optional[int] = None
+) -> Optional[bool]:
+    """
+    Reserve render slots for a user in a single round-trip
+
+    Args:
+        user_id: Owner of the renders
+        count: Number of slots to reserve
+        limit: Maximum concurrent renders allowed
+        seed: Active count from the database, used if the key is missing
+
+    Returns:
+        True if reserved, False if over the limit, None if the key is missing
+        and no seed was given
+
+    Raises:
+        RedisError: If Redis is unavailable (callers fall back to the database)
+    """
+    args = [count, limit, ACTIVE_RENDERS_TTL]
+    if seed is not None:
+        args.append(seed)
+
+    result = await redis_client.eval(_RESERVE_SCRIPT, 1, active_renders_key(user_id), *args)
+    if result == -1:
+        return None
+    return result != -2
+
+
+async def release_active_renders(user_id, count: int = 1) -> None:
+    """Release render slots reserved by the API (e.g. on delete or failed insert)"""
+    try:
+        await redis_client.eval(_RELEASE_SCRIPT, 1, active_renders_key(user_id), count)
+    except RedisError as e:
+        logger.warning(f"Error releasing active renders for {user_id}: {e}")
+
+
+def release_active_renders_sync(user_id, count: int = 1) -> None:
+    """Release render slots from a worker once a render completes or fails"""
+    try:
+        sync_redis_client.eval(_RELEASE_SCRIPT, 1, active_renders_key(user_id), count)
+    except RedisError as e:
+        logger.warning(f"Error releasing active renders for {user_id}: {e}")
+
+
+def video_cache_key(user_id, video_id) -> str:
+    """Redis key for a video's cached metadata; candidate listings live in a hash at <key>:candidates"""
+    return f"video:{user_id}:{video_id}"
+
+
+async def cached_json(
+    key: str,
+    loader: Callable[[], Awaitable[Any]],
+    ttl: int = VIDEO_CACHE_TTL,
+    field: Optional[str] = None
+) -> Any:
+    """
+    Return a JSON value from Redis, or load and cache it on a miss
+
+    Args:
+        key: Redis key (a hash when field is given)
+        loader: Coroutine function producing a JSON-serializable value
+        ttl: Expiry in seconds (for hashes, set once when the hash is created)
+        field: Hash field, so related entries can be dropped with one DELETE
+
+    Redis errors are logged and the loader result is returned uncached.
+    """
+    try:
+        cached = await (redis_client.hget(key, field) if field else redis_client.get(key))
+        if cached is not None:
+            return orjson.loads(cached)
+    except RedisError as e:
+        logger.warning(f"Error reading cache {key}: {e}")
+    
+    value = await loader()
+    
+    try:
+        if field:
+            async with redis_client.pipeline(transaction=True) as pipe:
+                pipe.hset(key, field, orjson.dumps(value))
+                pipe.expire(key, ttl, nx=True)
+                await pipe.execute()
+        else:
+            await redis_client.set(key, orjson.dumps(value), ex=ttl)
+    except RedisError as e:
+        logger.warning(f"Error writing cache {key}: {e}")
+    
+    return value
+
+
+async def invalidate_video_cache(user_id, video_id) -> None:
+    """Drop a video's cached metadata and candidate listings"""
+    key = video_cache_key(user_id, video_id)
+    try:
+        await redis_client.delete(key, f"{key}:candidates")
+    except RedisError as e:
+        logger.warning(f"Error invalidating cache for video {video_id}: {e}")
+
+
+def invalidate_video_cache_sync(user_id, video_id) -> None:
+    """Drop a video's cached entries from a worker after analysis updates it"""
+    key = video_cache_key(user_id, video_id)
+    try:
+        sync_redis_client.delete(key, f"{key}:candidates")
+    except RedisError as e:
+        logger.warning(f"Error invalidating cache for video {video_id}: {e}")
+
+
+def get_cached_transcript(fingerprint: str) -> Optional[dict]:
+    """Transcript cached by transcript_fingerprint, or None (workers, sync)"""
+    try:
+        cached = sync_redis_client.get(f"transcript:{fingerprint}")
+        return orjson.loads(cached) if cached is not None else None
+    except RedisError as e:
+        logger.warning(f"Error reading cached transcript: {e}")
+        return None
+
+
+def cache_transcript(fingerprint: str, transcript: dict) -> None:
+    """Store a transcript so re-analysing identical audio skips Whisper"""
+    try:
+        sync_redis_client.set(f"transcript:{fingerprint}", orjson.dumps(transcript), ex=TRANSCRIPT_CACHE_TTL)
+    except RedisError as e:
+        logger.warning(f"Error caching transcript: {e}")
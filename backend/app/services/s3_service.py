@@ -1,9 +1,18 @@
 
+import aioboto3
 import boto3
+from boto3.s3.transfer import TransferConfig
 from botocore.client import Config
 from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import AsyncExitStack, contextmanager, suppress
+from functools import lru_cache
+import asyncio
+import fcntl
+import orjson
 import os
-from typing import Optional
+import time
+from typing import Iterator, List, Optional, Tuple
 import logging
 
 logger = logging.getLogger(__name__)
@@ -15,16 +24,64 @@ S3_SECRET_KEY = os.getenv("S3_SECRET_KEY", "minioadmin")
 S3_BUCKET = os.getenv("S3_BUCKET", "anime-clips")
 S3_REGION = os.getenv("S3_REGION", "us-east-1")
 
-# Initialize S3 client
-s3_client = boto3.client(
-    's3',
+# SigV4 presigned URLs can't outlive 7 days
+MAX_PRESIGN_EXPIRY = 7 * 24 * 3600
+
+# Set to skip the startup bucket check (e.g. tests, pre-provisioned buckets)
+S3_SKIP_BUCKET_CHECK = os.getenv("S3_SKIP_BUCKET_CHECK", "").lower() in ("1", "true", "yes")
+
+# HTTP connections per client (botocore defaults to 10)
+S3_POOL = int(os.getenv("S3_POOL", "64"))
+
+S3_CLIENT_KWARGS = dict(
     endpoint_url=S3_ENDPOINT,
     aws_access_key_id=S3_ACCESS_KEY,
     aws_secret_access_key=S3_SECRET_KEY,
     region_name=S3_REGION,
-    config=Config(signature_version='s3v4')
+    config=Config(
+        signature_version='s3v4',
+        max_pool_connections=S3_POOL,
+        retries={'mode': 'adaptive', 'max_attempts': 5},
+        tcp_keepalive=True
+    )
 )
 
+# Worker-local cache of downloaded source videos, shared by all worker processes
+VIDEO_CACHE_DIR = os.getenv("VIDEO_CACHE_DIR", "/tmp/videos/sources")
+VIDEO_CACHE_MAX_BYTES = int(os.getenv("VIDEO_CACHE_MAX_BYTES", str(10 * 1024**3)))
+
+# Multipart settings for uploads from pipes (size unknown up front)
+STREAM_TRANSFER_CONFIG = TransferConfig(multipart_chunksize=8 * 1024 * 1024, use_threads=True)
+
+# Initialize S3 client (sync; used by Celery workers)
+s3_client = boto3.client('s3', **S3_CLIENT_KWARGS)
+
+# Async S3 client for the API, opened once in the app lifespan
+_aio_session = aioboto3.Session()
+_aio_exit_stack: Optional[AsyncExitStack] = None
+async_s3_client = None
+
+
+async def open_async_s3_client():
+    """Create the long-lived async S3 client (reuses connections across requests)"""
+    global _aio_exit_stack, async_s3_client
+    if async_s3_client is not None:
+        return
+    
+    _aio_exit_stack = AsyncExitStack()
+    async_s3_client = await _aio_exit_stack.enter_async_context(
+        _aio_session.client('s3', **S3_CLIENT_KWARGS)
+    )
+
+
+async def close_async_s3_client():
+    """Close the async S3 client and its connection pool"""
+    global _aio_exit_stack, async_s3_client
+    if _aio_exit_stack is not None:
+        await _aio_exit_stack.aclose()
+    _aio_exit_stack = None
+    async_s3_client = None
+
 
 def ensure_bucket_exists():
     """Ensure the S3 bucket exists, create if not"""
@@ -41,6 +98,35 @@ def ensure_bucket_exists():
             raise
 
 
+_bucket_ready = False
+_bucket_lock = asyncio.Lock()
+
+
+async def ensure_bucket_async():
+    """Ensure the S3 bucket exists, once per process, using the async client"""
+    global _bucket_ready
+    if _bucket_ready:
+        return
+    
+    async with _bucket_lock:
+        if _bucket_ready:
+            return
+        
+        try:
+            await async_s3_client.head_bucket(Bucket=S3_BUCKET)
+            logger.info(f"Bucket {S3_BUCKET} exists")
+        except ClientError as e:
+            error_code = e.response['Error']['Code']
+            if error_code == '404':
+                logger.info(f"Creating bucket {S3_BUCKET}")
+                await async_s3_client.create_bucket(Bucket=S3_BUCKET)
+            else:
+                logger.error(f"Error checking bucket: {e}")
+                raise
+        
+        _bucket_ready = True
+
+
 def generate_signed_upload_url(
     s3_key: str,
     content_type: str = "video/mp4",
@@ -74,29 +160,166 @@ def generate_signed_upload_url(
         raise
 
 
-def generate_signed_download_url(
+async def generate_signed_upload_url_async(
     s3_key: str,
-    expires_in: int = 86400
+    content_type: str = "video/mp4",
+    expires_in: int = 3600
 ) -> str:
     """
-    Generate a pre-signed URL for downloading a file from S3
+    Async version of generate_signed_upload_url for API handlers
     
     Args:
         s3_key: S3 object key (path)
-        expires_in: URL expiration time in seconds (default: 24 hours)
+        content_type: MIME type of the file
+        expires_in: URL expiration time in seconds
     
     Returns:
         Signed URL string
     """
     try:
-        url = s3_client.generate_presigned_url(
-            'get_object',
+        url = await async_s3_client.generate_presigned_url(
+            'put_object',
             Params={
                 'Bucket': S3_BUCKET,
-                'Key': s3_key
+                'Key': s3_key,
+                'ContentType': content_type
             },
             ExpiresIn=expires_in
         )
+        logger.info(f"Generated upload URL for {s3_key}")
+        return url
+    except ClientError as e:
+        logger.error(f"Error generating upload URL: {e}")
+        raise
+
+
+async def create_multipart_upload_async(
+    s3_key: str,
+    part_count: int,
+    content_type: str = "video/mp4",
+    expires_in: int = 3600
+) -> Tuple[str, List[str]]:
+    """
+    Start a multipart upload and presign a URL for each part
+    
+    Args:
+        s3_key: S3 object key (path)
+        part_count: Number of parts the client will upload
+        content_type: MIME type of the file
+        expires_in: URL expiration time in seconds
+    
+    Returns:
+        (multipart upload ID, signed part URLs in part-number order)
+    """
+    try:
+        mpu = await async_s3_client.create_multipart_upload(
+            Bucket=S3_BUCKET,
+            Key=s3_key,
+            ContentType=content_type
+        )
+        mpu_id = mpu['UploadId']
+        
+        urls = await asyncio.gather(*(
+            async_s3_client.generate_presigned_url(
+                'upload_part',
+                Params={
+                    'Bucket': S3_BUCKET,
+                    'Key': s3_key,
+                    'UploadId': mpu_id,
+                    'PartNumber': part_number
+                },
+                ExpiresIn=expires_in
+            )
+            for part_number in range(1, part_count + 1)
+        ))
+        logger.info(f"Started multipart upload for {s3_key} ({part_count} parts)")
+        return mpu_id, list(urls)
+    except ClientError as e:
+        logger.error(f"Error starting multipart upload: {e}")
+        raise
+
+
+async def complete_multipart_upload_async(s3_key: str, mpu_id: str, parts: List[dict]):
+    """
+    Assemble an uploaded multipart object
+    
+    Args:
+        s3_key: S3 object key (path)
+        mpu_id: Multipart upload ID from create_multipart_upload_async
+        parts: [{'PartNumber': int, 'ETag': str}, ...] for every uploaded part
+    """
+    try:
+        await async_s3_client.complete_multipart_upload(
+            Bucket=S3_BUCKET,
+            Key=s3_key,
+            UploadId=mpu_id,
+            MultipartUpload={'Parts': sorted(parts, key=lambda p: p['PartNumber'])}
+        )
+        logger.info(f"Completed multipart upload for {s3_key}")
+    except ClientError as e:
+        logger.error(f"Error completing multipart upload: {e}")
+        raise
+
+
+async def put_json_async(s3_key: str, value) -> str:
+    """
+    Store a JSON document in S3 (e.g. task arguments too large for the broker)
+    
+    Args:
+        s3_key: S3 object key (destination path)
+        value: orjson-serializable value
+    
+    Returns:
+        The S3 key, for passing to get_json
+    """
+    try:
+        await async_s3_client.put_object(
+            Bucket=S3_BUCKET,
+            Key=s3_key,
+            Body=orjson.dumps(value),
+            ContentType='application/json'
+        )
+        return s3_key
+    except ClientError as e:
+        logger.error(f"Error storing JSON in S3: {e}")
+        raise
+
+
+@lru_cache(maxsize=4096)
+def _cached_download_url(bucket: str, s3_key: str, expires_in: int, window: int) -> str:
+    """Sign a download URL once per (key, expiry, time window)"""
+    # Sign past the window end so any reuse still has expires_in left
+    window_s = max(expires_in // 2, 1)
+    return s3_client.generate_presigned_url(
+        'get_object',
+        Params={
+            'Bucket': bucket,
+            'Key': s3_key
+        },
+        ExpiresIn=min(expires_in + window_s, MAX_PRESIGN_EXPIRY)
+    )
+
+
+def generate_signed_download_url(
+    s3_key: str,
+    expires_in: int = 86400
+) -> str:
+    """
+    Generate a pre-signed URL for downloading a file from S3
+    
+    URLs are memoized per half-expiry window, so repeat requests for the
+    same key reuse one signature instead of re-signing every time.
+    
+    Args:
+        s3_key: S3 object key (path)
+        expires_in: URL expiration time in seconds (default: 24 hours)
+    
+    Returns:
+        Signed URL string
+    """
+    try:
+        window = int(time.time() // max(expires_in // 2, 1))
+        url = _cached_download_url(S3_BUCKET, s3_key, expires_in, window)
         logger.info(f"Generated download URL for {s3_key}")
         return url
     except ClientError as e:
@@ -104,6 +327,33 @@ def generate_signed_download_url(
         raise
 
 
+def generate_stream_url(s3_url: str, expires_in: int = 7200) -> str:
+    """
+    Generate a pre-signed GET URL that FFmpeg/ffprobe can read directly
+    
+    Args:
+        s3_url: S3 URL (s3://bucket/key or just the key)
+        expires_in: URL expiration time in seconds; must outlast the task
+    
+    Returns:
+        Signed URL string
+    """
+    if s3_url.startswith('s3://'):
+        bucket, _, s3_key = s3_url.replace('s3://', '').partition('/')
+    else:
+        bucket, s3_key = S3_BUCKET, s3_url
+    
+    try:
+        return s3_client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': bucket, 'Key': s3_key},
+            ExpiresIn=expires_in
+        )
+    except ClientError as e:
+        logger.error(f"Error generating stream URL: {e}")
+        raise
+
+
 def upload_to_s3(
     local_path: str,
     s3_key: str,
@@ -142,6 +392,46 @@ def upload_to_s3(
         raise
 
 
+def upload_stream_to_s3(
+    stream,
+    s3_key: str,
+    content_type: Optional[str] = None
+) -> str:
+    """
+    Upload a readable binary stream (e.g. a subprocess pipe) to S3
+    
+    The stream is sent in multipart chunks as it is read, so the data never
+    touches local disk.
+    
+    Args:
+        stream: File-like object opened for binary reading
+        s3_key: S3 object key (destination path)
+        content_type: Optional MIME type
+    
+    Returns:
+        S3 URL of uploaded file
+    """
+    try:
+        extra_args = {}
+        if content_type:
+            extra_args['ContentType'] = content_type
+        
+        s3_client.upload_fileobj(
+            stream,
+            S3_BUCKET,
+            s3_key,
+            ExtraArgs=extra_args,
+            Config=STREAM_TRANSFER_CONFIG
+        )
+        
+        logger.info(f"Streamed upload to s3://{S3_BUCKET}/{s3_key}")
+        return f"s3://{S3_BUCKET}/{s3_key}"
+    
+    except ClientError as e:
+        logger.error(f"Error streaming upload to S3: {e}")
+        raise
+
+
 def download_from_s3(s3_url: str, local_path: str):
     """
     Download a file from S3 to local path
@@ -174,6 +464,24 @@ def download_from_s3(s3_url: str, local_path: str):
         raise
 
 
+def get_json(s3_key: str):
+    """
+    Read a JSON document stored with put_json_async
+    
+    Args:
+        s3_key: S3 object key
+    
+    Returns:
+        The decoded value
+    """
+    try:
+        response = s3_client.get_object(Bucket=S3_BUCKET, Key=s3_key)
+        return orjson.loads(response['Body'].read())
+    except ClientError as e:
+        logger.error(f"Error reading JSON from S3: {e}")
+        raise
+
+
 def delete_from_s3(s3_url: str):
     """
     Delete a file from S3
@@ -207,25 +515,34 @@ def delete_folder_from_s3(s3_prefix: str):
         s3_prefix: S3 key prefix (folder path)
     """
     try:
-        # List all objects with prefix
+        # List all objects with prefix (pages hold at most 1000 keys,
+        # matching the delete_objects limit)
         paginator = s3_client.get_paginator('list_objects_v2')
         pages = paginator.paginate(Bucket=S3_BUCKET, Prefix=s3_prefix)
         
-        delete_keys = []
-        for page in pages:
-            if 'Contents' in page:
-                for obj in page['Contents']:
-                    delete_keys.append({'Key': obj['Key']})
+        # Delete each page as soon as it is listed, overlapping round-trips
+        deleted = 0
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            futures = []
+            for page in pages:
+                if 'Contents' in page:
+                    batch = [{'Key': obj['Key']} for obj in page['Contents']]
+                    deleted += len(batch)
+                    futures.append(executor.submit(
+                        s3_client.delete_objects,
+                        Bucket=S3_BUCKET,
+                        Delete={'Objects': batch, 'Quiet': True}
+                    ))
+            
+            # Quiet mode only reports failures
+            errors = []
+            for future in as_completed(futures):
+                errors.extend(future.result().get('Errors', []))
         
-        # Delete objects in batches
-        if delete_keys:
-            for i in range(0, len(delete_keys), 1000):  # S3 limit is 1000 per request
-                batch = delete_keys[i:i+1000]
-                s3_client.delete_objects(
-                    Bucket=S3_BUCKET,
-                    Delete={'Objects': batch}
-                )
-            logger.info(f"Deleted {len(delete_keys)} objects with prefix {s3_prefix}")
+        if errors:
+            logger.error(f"Failed to delete {len(errors)} objects with prefix {s3_prefix}: {errors[:5]}")
+        if deleted:
+            logger.info(f"Deleted {deleted - len(errors)} objects with prefix {s3_prefix}")
     
     except ClientError as e:
         logger.error(f"Error deleting folder from S3: {e}")
@@ -319,8 +636,82 @@ def copy_file(source_key: str, dest_key: str):
         raise
 
 
-# Initialize bucket on module import
-try:
-    ensure_bucket_exists()
-except Exception as e:
-    logger.warning(f"Could not ensure bucket exists (may be running tests): {e}")
+class VideoCache:
+    """
+    Size-bounded on-disk LRU of source videos, keyed by video ID
+    
+    Prefork processes coordinate through a flock on <id>.mp4.lock: fetches
+    hold it exclusively and users hold it shared, so a video is downloaded
+    once and never evicted while a render is reading it. Hits touch the
+    file's mtime, which orders eviction.
+    """
+    
+    def __init__(self, directory: str = VIDEO_CACHE_DIR, max_bytes: int = VIDEO_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+    
+    @contextmanager
+    def get_or_fetch(self, video_id, s3_url: str) -> Iterator[str]:
+        """
+        Yield a local path to the video, downloading it on a miss
+        
+        Args:
+            video_id: Video ID (cache key)
+            s3_url: S3 URL to download from on a miss
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{video_id}.mp4")
+        
+        with open(f"{path}.lock", 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_SH)
+            if os.path.exists(path):
+                os.utime(path)
+            else:
+                # Re-check under the exclusive lock; another process may have fetched it
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                if not os.path.exists(path):
+                    try:
+                        download_from_s3(s3_url, f"{path}.part")
+                    except Exception:
+                        # Eviction only counts .mp4 files, so a partial download would never be reclaimed
+                        with suppress(FileNotFoundError):
+                            os.remove(f"{path}.part")
+                        raise
+                    os.replace(f"{path}.part", path)
+                fcntl.flock(lock, fcntl.LOCK_SH)
+                self.evict()
+            
+            yield path
+    
+    def evict(self):
+        """Delete least recently used videos until the cache fits in max_bytes"""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.mp4'):
+                # Another process may evict it between scandir and stat
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            
+            # Skip videos in use (or being fetched); lock files are kept so
+            # every process keeps locking the same inode
+            with open(f"{path}.lock", 'a') as lock:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                # Another process may have evicted it before we got the lock
+                with suppress(FileNotFoundError):
+                    os.remove(path)
+                total -= size
+                logger.info(f"Evicted {path} from video cache")
+
+
+video_cache = VideoCache()
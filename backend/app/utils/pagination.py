@@ -0,0 +1,72 @@
+from fastapi import HTTPException, status
+from sqlalchemy import Select, tuple_
+from sqlalchemy.sql.lambdas import StatementLambdaElement
+from datetime import datetime
+from typing import Any, List, Optional, Tuple, Union
+from uuid import UUID
+import base64
+import json
+
+
+def encode_cursor(sort_value: Any, row_id: UUID) -> str:
+    """Encode the (sort value, id) of the last row on a page as an opaque cursor"""
+    if isinstance(sort_value, datetime):
+        sort_value = sort_value.isoformat()
+    payload = json.dumps([sort_value, str(row_id)])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor: str, value_type: type = datetime) -> Tuple[Any, UUID]:
+    """Decode a cursor from encode_cursor, raising 400 if it is malformed"""
+    try:
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if value_type is datetime:
+            sort_value = datetime.fromisoformat(sort_value)
+        else:
+            sort_value = value_type(sort_value)
+        return sort_value, UUID(row_id)
+    except (ValueError, TypeError, AttributeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid pagination cursor"
+        )
+
+
+def keyset_paginate(
+    query: Union[Select, StatementLambdaElement],
+    model,
+    cursor: Optional[str],
+    limit: int,
+    sort_column=None
+) -> Union[Select, StatementLambdaElement]:
+    """
+    Apply descending keyset pagination on (sort_column, id)
+
+    sort_column defaults to model.created_at (newest first). Fetches one
+    extra row so keyset_page can tell whether a next page exists. Lambda
+    statements are extended with lambdas so they stay in the statement cache.
+    """
+    if sort_column is None:
+        sort_column = model.created_at
+
+    page_size = limit + 1
+    steps = []
+    if cursor:
+        sort_value, row_id = decode_cursor(cursor, sort_column.type.python_type)
+        steps.append(lambda s: s.where(tuple_(sort_column, model.id) < tuple_(sort_value, row_id)))
+    steps.append(lambda s: s.order_by(sort_column.desc(), model.id.desc()).limit(page_size))
+
+    for step in steps:
+        query = query + step if isinstance(query, StatementLambdaElement) else step(query)
+    return query
+
+
+def keyset_page(rows: List, limit: int, sort_key: str = "created_at") -> dict:
+    """Split the rows from keyset_paginate into the page items and next cursor"""
+    items = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        last = items[-1]
+        next_cursor = encode_cursor(getattr(last, sort_key), last.id)
+
+    return {"items": items, "next_cursor": next_cursor}
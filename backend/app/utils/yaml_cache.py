@@ -0,0 +1,59 @@
+from collections import OrderedDict
+from typing import Dict, Tuple
+import copy
+import os
+import threading
+
+import yaml
+
+# Use the libyaml C loader when available (bundled with PyYAML wheels)
+try:
+    from yaml import CSafeLoader as _Loader
+except ImportError:
+    from yaml import SafeLoader as _Loader
+
+# Max number of distinct YAML files kept in memory
+MAX_ENTRIES = 100
+
+# path -> (mtime, size, parsed data)
+_cache: "OrderedDict[str, Tuple[float, int, Dict]]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def load_yaml_cached(path: str) -> Dict:
+    """
+    Load a YAML file, re-parsing only when it changes on disk
+    
+    The parsed document is cached keyed by path and validated against the
+    file's (mtime, size) on every call, so edits are picked up without a
+    restart. A deep copy is returned so callers can't poison the cache.
+    
+    Raises:
+        FileNotFoundError: If the file does not exist
+    """
+    stat = os.stat(path)
+    key = os.path.abspath(path)
+    
+    with _lock:
+        entry = _cache.get(key)
+        if entry is not None and entry[0] == stat.st_mtime and entry[1] == stat.st_size:
+            _cache.move_to_end(key)
+            return copy.deepcopy(entry[2])
+    
+    # Cache miss - parse outside the lock
+    with open(path, 'r') as f:
+        data = yaml.load(f, Loader=_Loader) or {}
+    
+    with _lock:
+        _cache[key] = (stat.st_mtime, stat.st_size, data)
+        _cache.move_to_end(key)
+        while len(_cache) > MAX_ENTRIES:
+            _cache.popitem(last=False)
+    
+    return copy.deepcopy(data)
+
+
+def clear_yaml_cache():
+    """Drop all cached YAML documents"""
+    with _lock:
+        _cache.clear()
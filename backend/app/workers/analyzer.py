@@ -1,17 +1,68 @@
+import hashlib
 import os
+import shutil
 import subprocess
 import json
+import threading
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
 import numpy as np
 import cv2
-import whisper
-from typing import List, Dict, Tuple
+from faster_whisper import WhisperModel
+from typing import Dict, Iterator, List, Optional, Tuple
 from celery import Task
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 
-from app.workers.celery_app import celery_app
+from app.workers.celery_app import ProgressReporter, celery_app, make_scratch_dir
 from app.database import SessionLocal
 from app.models import Job, Video, Transcript, Candidate
-from app.services.s3_service import download_from_s3, upload_to_s3
+from app.services.s3_service import delete_from_s3, generate_stream_url, get_json, upload_to_s3, video_cache
+from app.services.redis_service import cache_transcript, get_cached_transcript, invalidate_video_cache_sync
+
+# Whisper models loaded in this worker process, by model name. Loaded lazily on
+# the first task (not at import) so nothing touches CUDA before the fork.
+_WHISPER_CACHE: Dict[Tuple[str, str], WhisperModel] = {}
+_WHISPER_LOCK = threading.Lock()
+
+# faster-whisper (CTranslate2) settings; int8 is ~3-5x faster than FP32 on CPU
+WHISPER_COMPUTE_TYPE = os.getenv("WHISPER_COMPUTE_TYPE", "int8")
+WHISPER_GPU_COMPUTE_TYPE = os.getenv("WHISPER_GPU_COMPUTE_TYPE", "float16")
+WHISPER_CACHE_DIR = os.getenv("WHISPER_CACHE_DIR", os.path.expanduser("~/.cache/whisper"))
+
+# Concurrent FFmpeg thumbnail extractions + uploads per analysis task
+THUMBNAIL_WORKERS = int(os.getenv("THUMBNAIL_WORKERS", min(8, os.cpu_count() or 1)))
+
+# Read the source video over a presigned URL instead of downloading it first.
+# FFmpeg streams each pass and seeks thumbnails with HTTP range requests; set
+# to 0 when the object store is remote and repeated reads are expensive.
+ANALYSIS_STREAM_FROM_S3 = os.getenv("ANALYSIS_STREAM_FROM_S3", "1").lower() in ("1", "true", "yes")
+
+# Route analysis to the GPU task (set on the API when GPU workers are deployed)
+ANALYSIS_GPU = os.getenv("ANALYSIS_GPU", "").lower() in ("1", "true", "yes")
+
+# CPU threads for transcription (lower this with higher worker concurrency)
+WHISPER_THREADS = int(os.getenv("WHISPER_THREADS", os.cpu_count() or 1))
+
+
+def get_whisper_model(name: str, device: str = "cpu") -> WhisperModel:
+    """Load a Whisper model once per worker process and reuse it across tasks"""
+    key = (name, device)
+    model = _WHISPER_CACHE.get(key)
+    if model is None:
+        with _WHISPER_LOCK:
+            model = _WHISPER_CACHE.get(key)
+            if model is None:
+                model = WhisperModel(
+                    name,
+                    device=device,
+                    compute_type=WHISPER_GPU_COMPUTE_TYPE if device == "cuda" else WHISPER_COMPUTE_TYPE,
+                    cpu_threads=WHISPER_THREADS,
+                    download_root=WHISPER_CACHE_DIR
+                )
+                _WHISPER_CACHE[key] = model
+    return model
 
 
 class VideoAnalyzer:
@@ -26,15 +77,19 @@ class VideoAnalyzer:
     def get_video_info(self) -> Dict:
         """Extract video metadata using FFprobe"""
         cmd = [
-            'ffprobe', '-v', 'quiet', '-print_format', 'json',
-            '-show_format', '-show_streams', self.video_path
+            'ffprobe', '-v', 'error', '-select_streams', 'v:0',
+            '-show_entries', 'stream=r_frame_rate,width,height:format=duration',
+            '-of', 'json', self.video_path
         ]
-        result = subprocess.run(cmd, capture_output=True, text=True)
+        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
         info = json.loads(result.stdout)
         
-        video_stream = next(s for s in info['streams'] if s['codec_type'] == 'video')
+        video_stream = info['streams'][0]
         self.duration = float(info['format']['duration'])
-        self.fps = eval(video_stream['r_frame_rate'])  # e.g., "24/1"
+        
+        # Frame rate as a fraction, e.g. "24000/1001"
+        num, _, den = video_stream['r_frame_rate'].partition('/')
+        self.fps = int(num) / int(den) if den and int(den) else float(num)
         
         return {
             'duration': self.duration,
@@ -51,235 +106,388 @@ class VideoAnalyzer:
         subprocess.run(cmd, check=True, capture_output=True)
         return output_path
     
+    def transcript_fingerprint(self, audio_path: str) -> str:
+        """Cache key for a transcript: model, language and a hash of the WAV bytes"""
+        digest = hashlib.blake2b(digest_size=20)
+        with open(audio_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        
+        model_name = self.config.get('whisper_model', 'base')
+        return f"{model_name}:{self.config.get('language') or 'auto'}:{digest.hexdigest()}"
+    
     def transcribe_audio(self, audio_path: str) -> Dict:
-        """Run Whisper ASR with word-level timestamps"""
-        model = whisper.load_model(self.config.get('whisper_model', 'base'))
-        result = model.transcribe(
+        """Run Whisper ASR with word-level timestamps (cached by audio content)"""
+        fingerprint = self.transcript_fingerprint(audio_path)
+        cached = get_cached_transcript(fingerprint)
+        if cached is not None:
+            return cached
+        
+        model = get_whisper_model(
+            self.config.get('whisper_model', 'base'),
+            self.config.get('whisper_device', 'cpu')
+        )
+        language = self.config.get('language')
+        segments, info = model.transcribe(
             audio_path,
-            language=self.config.get('language', None),  # None = auto-detect
-            word_timestamps=True
+            language=None if language in (None, 'auto') else language,  # None = auto-detect
+            word_timestamps=True,
+            vad_filter=True
         )
         
-        # Extract word-level data
+        # Extract word-level data (segments is a generator; this runs the decode)
         words = []
-        for segment in result['segments']:
-            for word_data in segment.get('words', []):
+        text = []
+        for segment in segments:
+            text.append(segment.text)
+            for word_data in segment.words or []:
                 words.append({
-                    'word': word_data['word'].strip(),
-                    'start': word_data['start'],
-                    'end': word_data['end'],
-                    'confidence': word_data.get('probability', 1.0)
+                    'word': word_data.word.strip(),
+                    'start': word_data.start,
+                    'end': word_data.end,
+                    'confidence': word_data.probability
                 })
         
-        return {
-            'language': result['language'],
+        transcript = {
+            'language': info.language,
             'words': words,
-            'text': result['text']
+            'text': ''.join(text)
         }
+        cache_transcript(fingerprint, transcript)
+        return transcript
+    
+    def iter_frames(self, sample_rate: int, width: int, height: int, pix_fmt: str) -> Iterator[np.ndarray]:
+        """
+        Yield every sample_rate-th frame, scaled and converted by FFmpeg
+        
+        FFmpeg drops the unsampled frames and does the resize/colour conversion,
+        so Python only sees small raw frames read straight from the pipe.
+        """
+        channels = 3 if pix_fmt == 'rgb24' else 1
+        shape = (height, width, channels) if channels > 1 else (height, width)
+        frame_size = width * height * channels
+        
+        cmd = [
+            'ffmpeg', '-v', 'error', '-hwaccel', 'auto', '-i', self.video_path,
+            '-map', '0:v:0', '-an', '-sn',
+            '-vf', f"fps={self.fps / sample_rate:.6f},scale={width}:{height},format={pix_fmt}",
+            '-f', 'rawvideo', '-pix_fmt', pix_fmt, '-'
+        ]
+        with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL) as proc:
+            while True:
+                data = proc.stdout.read(frame_size)
+                if len(data) < frame_size:
+                    break
+                yield np.frombuffer(data, dtype=np.uint8).reshape(shape)
+        
+        if proc.returncode != 0:
+            raise subprocess.CalledProcessError(proc.returncode, cmd)
     
     def detect_scenes(self, threshold: float = 0.3) -> List[float]:
-        """Detect scene boundaries using histogram differences"""
-        cap = cv2.VideoCapture(self.video_path)
+        """Detect scene boundaries using luma histogram distances"""
         scene_boundaries = [0.0]
         prev_hist = None
-        frame_count = 0
         sample_rate = 3  # Check every 3rd frame
         
-        while cap.isOpened():
-            ret, frame = cap.read()
-            if not ret:
-                break
+        for index, gray in enumerate(self.iter_frames(sample_rate, 160, 90, 'gray')):
+            hist = cv2.calcHist([gray], [0], None, [64], [0, 256])
+            cv2.normalize(hist, hist, 1, 0, cv2.NORM_L1)
             
-            if frame_count % sample_rate == 0:
-                # Downsample and convert to HSV
-                small = cv2.resize(frame, (160, 90))
-                hsv = cv2.cvtColor(small, cv2.COLOR_BGR2HSV)
-                hist = cv2.calcHist([hsv], [0, 1], None, [50, 60], [0, 180, 0, 256])
-                hist = cv2.normalize(hist, hist).flatten()
-                
-                if prev_hist is not None:
-                    # Compare histograms
-                    diff = np.sum(np.abs(hist - prev_hist))
-                    if diff > threshold:
-                        timestamp = frame_count / self.fps
-                        scene_boundaries.append(timestamp)
-                
-                prev_hist = hist
+            if prev_hist is not None:
+                # Bhattacharyya distance: 0 = identical, 1 = no overlap
+                diff = cv2.compareHist(prev_hist, hist, cv2.HISTCMP_BHATTACHARYYA)
+                if diff > threshold:
+                    timestamp = index * sample_rate / self.fps
+                    scene_boundaries.append(timestamp)
             
-            frame_count += 1
+            prev_hist = hist
         
-        cap.release()
         scene_boundaries.append(self.duration)
         return scene_boundaries
     
     def compute_motion_scores(self, sample_rate: int = 5) -> np.ndarray:
         """Compute motion intensity per second using frame differencing"""
-        cap = cv2.VideoCapture(self.video_path)
-        motion_scores = []
-        prev_gray = None
-        frame_count = 0
-        current_second = 0
-        second_diffs = []
-        
-        while cap.isOpened():
-            ret, frame = cap.read()
-            if not ret:
-                break
-            
-            if frame_count % sample_rate == 0:
-                gray = cv2.cvtColor(cv2.resize(frame, (320, 180)), cv2.COLOR_BGR2GRAY)
-                
+        def frame_diffs():
+            prev_gray = None
+            for gray in self.iter_frames(sample_rate, 320, 180, 'gray'):
                 if prev_gray is not None:
-                    diff = cv2.absdiff(gray, prev_gray)
-                    motion = np.mean(diff)
-                    
-                    second = int(frame_count / self.fps)
-                    if second > current_second:
-                        # Store average motion for previous second
-                        motion_scores.append(np.mean(second_diffs) if second_diffs else 0)
-                        second_diffs = []
-                        current_second = second
-                    
-                    second_diffs.append(motion)
-                
+                    # Mean absolute difference in one pass, without an absdiff image
+                    yield cv2.norm(gray, prev_gray, cv2.NORM_L1) / gray.size
                 prev_gray = gray
-            
-            frame_count += 1
         
-        cap.release()
+        diffs = np.fromiter(frame_diffs(), dtype=np.float32)
+        if diffs.size == 0:
+            return diffs
         
-        # Add final second
-        if second_diffs:
-            motion_scores.append(np.mean(second_diffs))
+        # Average the diffs within each second (diff i ends at sampled frame i + 1)
+        seconds = (np.arange(1, diffs.size + 1) * sample_rate / self.fps).astype(np.int64)
+        counts = np.bincount(seconds)
+        motion_array = np.bincount(seconds, weights=diffs)
+        np.divide(motion_array, counts, out=motion_array, where=counts > 0)
         
         # Normalize to 0-1
-        motion_array = np.array(motion_scores)
-        if motion_array.max() > 0:
-            motion_array = motion_array / motion_array.max()
+        peak = motion_array.max()
+        if peak > 0:
+            motion_array /= peak
         
         return motion_array
     
     def compute_audio_peaks(self, audio_path: str) -> np.ndarray:
-        """Detect audio energy peaks per second"""
-        # Use FFmpeg to get audio RMS per second
-        cmd = [
-            'ffmpeg', '-i', audio_path, '-af',
-            'astats=metadata=1:reset=1,ametadata=print:key=lavfi.astats.Overall.RMS_level:file=-',
-            '-f', 'null', '-'
-        ]
-        result = subprocess.run(cmd, capture_output=True, text=True, stderr=subprocess.STDOUT)
-        
-        # Parse RMS values (simplified - in production, use more robust parsing)
-        rms_values = []
-        for line in result.stdout.split('\n'):
-            if 'lavfi.astats.Overall.RMS_level' in line:
-                try:
-                    value = float(line.split('=')[-1])
-                    rms_values.append(abs(value))  # Convert dB to positive
-                except:
-                    continue
+        """Detect audio energy peaks per second (RMS of the extracted 16kHz mono WAV)"""
+        with wave.open(audio_path, 'rb') as wav:
+            sample_rate = wav.getframerate()
+            pcm = wav.readframes(wav.getnframes())
+        
+        # extract_audio writes 16-bit PCM; square in float32 to avoid overflow
+        samples = np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768.0
+        if samples.size == 0:
+            return np.zeros(0)
         
-        # Group by second
-        audio_scores = []
-        fps = len(rms_values) / self.duration if self.duration > 0 else 1
-        for i in range(int(self.duration)):
-            start_idx = int(i * fps)
-            end_idx = int((i + 1) * fps)
-            second_values = rms_values[start_idx:end_idx]
-            audio_scores.append(np.mean(second_values) if second_values else 0)
+        # RMS per second
+        boundaries = np.arange(0, samples.size, sample_rate)
+        counts = np.diff(np.append(boundaries, samples.size))
+        audio_array = np.sqrt(np.add.reduceat(samples * samples, boundaries) / counts)
         
         # Normalize
-        audio_array = np.array(audio_scores)
-        if audio_array.max() > 0:
-            audio_array = audio_array / audio_array.max()
+        peak = audio_array.max()
+        if peak > 0:
+            audio_array /= peak
         
         return audio_array
 
 
-def detect_hook_phrases(words: List[Dict], start_s: float, end_s: float) -> float:
-    """Score speech hooks in the first 2-3 seconds"""
-    hook_words = {'wait', 'hey', 'no', 'stop', 'what', 'now', 'look', 'watch'}
-    question_words = {'who', 'what', 'where', 'when', 'why', 'how'}
+HOOK_WORDS = frozenset({'wait', 'hey', 'no', 'stop', 'what', 'now', 'look', 'watch'})
+QUESTION_WORDS = frozenset({'who', 'what', 'where', 'when', 'why', 'how'})
+
+
+class TranscriptIndex:
+    """
+    Transcript words as parallel arrays sorted by start time
     
-    score = 0.0
-    early_window = start_s + 2.5  # First 2.5 seconds
+    Built once per video so scoring can binary-search a clip's words instead
+    of rescanning every word dict for each candidate.
+    """
     
-    for word in words:
-        if word['start'] < start_s or word['start'] > end_s:
-            continue
-        
-        word_lower = word['word'].lower().strip('.,!?')
-        
-        # Hook words in first 2.5s
-        if word['start'] <= early_window:
-            if word_lower in hook_words:
-                score += 0.5
-            if word_lower in question_words:
-                score += 0.3
+    def __init__(self, words: List[Dict]):
+        words = sorted(words, key=lambda w: w['start'])
+        self.starts = np.array([w['start'] for w in words], dtype=np.float64)
+        self.lowered = [w['word'].lower() for w in words]
+        
+        # Lowercased transcript text and each word's character span in it
+        self.text = ' '.join(self.lowered)
+        lengths = np.array([len(w) for w in self.lowered], dtype=np.int64)
+        self.char_starts = np.cumsum(lengths + 1) - lengths - 1
+        self.char_ends = self.char_starts + lengths
+        
+        # Per-word hook score
+        self.hook_scores = hook_scores = np.zeros(len(words))
+        for i, word in enumerate(words):
+            cleaned = self.lowered[i].strip('.,!?')
+            if cleaned in HOOK_WORDS:
+                hook_scores[i] += 0.5
+            if cleaned in QUESTION_WORDS:
+                hook_scores[i] += 0.3
             if word['word'].endswith('!'):
-                score += 0.2
+                hook_scores[i] += 0.2
+    
+    def window(self, start_s: float, end_s: float) -> Tuple[int, int]:
+        """Index range of words starting within [start_s, end_s]"""
+        lo = int(np.searchsorted(self.starts, start_s, side='left'))
+        hi = int(np.searchsorted(self.starts, end_s, side='right'))
+        return lo, max(lo, hi)
     
-    return min(score, 1.0)
+    def keyword_counts(self, keywords: List[str], starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+        """
+        Number of keywords occurring in each window's text (words joined by spaces)
+        
+        Each keyword is located once in the full text; a window matches if an
+        occurrence falls entirely inside its character span.
+        """
+        lo = np.searchsorted(self.starts, starts, side='left')
+        hi = np.maximum(lo, np.searchsorted(self.starts, ends, side='right'))
+        has_words = hi > lo
+        span_start = self.char_starts[np.minimum(lo, len(self.starts) - 1)] if len(self.starts) else lo
+        span_end = self.char_ends[hi - 1] if len(self.starts) else hi
+        
+        counts = np.zeros(len(starts))
+        for keyword in keywords:
+            keyword = keyword.lower()
+            if not keyword:
+                counts += 1  # The empty string is in every window
+                continue
+            
+            occurrences = []
+            pos = self.text.find(keyword)
+            while pos != -1:
+                occurrences.append(pos)
+                pos = self.text.find(keyword, pos + 1)
+            if not occurrences:
+                continue
+            
+            # First occurrence starting inside each span is the one most likely to end inside it
+            occurrences = np.array(occurrences, dtype=np.int64)
+            idx = np.searchsorted(occurrences, span_start, side='left')
+            found = idx < len(occurrences)
+            first = occurrences[np.minimum(idx, len(occurrences) - 1)]
+            counts += has_words & found & (first + len(keyword) <= span_end)
+        
+        return counts
 
 
-def score_candidate(
-    start_s: float,
-    end_s: float,
-    transcript_words: List[Dict],
+def detect_hook_phrases(transcript: TranscriptIndex, start_s: float, end_s: float) -> float:
+    """Score speech hooks in the first 2-3 seconds"""
+    early_window = start_s + 2.5  # First 2.5 seconds
+    lo, hi = transcript.window(start_s, min(end_s, early_window))
+    score = transcript.hook_scores[lo:hi].sum()
+    
+    return min(float(score), 1.0)
+
+
+def window_means(scores: np.ndarray, start_idx: np.ndarray, end_idx: np.ndarray) -> np.ndarray:
+    """Mean of scores[start:end] for every window at once (0 if it starts past the end)"""
+    cumsum = np.concatenate(([0.0], np.cumsum(scores)))
+    end_idx = np.minimum(end_idx, len(scores))
+    valid = start_idx < end_idx
+    
+    means = np.zeros(len(start_idx))
+    means[valid] = (cumsum[end_idx[valid]] - cumsum[start_idx[valid]]) / (end_idx[valid] - start_idx[valid])
+    return means
+
+
+def overlap_penalties(starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """
+    Fraction of each window covered by the windows generated before it
+    
+    Windows come in scene order, so starts are non-decreasing and only the
+    previous `depth` windows (those starting within one max-length) can
+    overlap a window. Overlaps are summed one neighbour offset at a time,
+    each offset vectorized across all windows.
+    """
+    count = len(starts)
+    max_length = (ends - starts).max()
+    first_overlapping = np.searchsorted(starts, starts - max_length, side='left')
+    depth = int((np.arange(count) - first_overlapping).max())
+    
+    overlap_total = np.zeros(count)
+    for offset in range(1, depth + 1):
+        overlap = np.minimum(ends[offset:], ends[:-offset]) - np.maximum(starts[offset:], starts[:-offset])
+        overlap_total[offset:] += np.maximum(overlap, 0.0)
+    
+    return overlap_total / (ends - starts)
+
+
+def score_candidates(
+    windows: List[Tuple[float, float]],
+    transcript: TranscriptIndex,
     motion_scores: np.ndarray,
     audio_scores: np.ndarray,
     keywords: List[str],
-    existing_candidates: List[Tuple[float, float]],
     weights: Dict[str, float]
-) -> Tuple[float, Dict]:
-    """Score a candidate clip segment"""
+) -> List[Dict]:
+    """Score candidate clip segments (in generation order) in one vectorized pass"""
+    if not windows:
+        return []
+    
+    starts = np.array([w[0] for w in windows], dtype=np.float64)
+    ends = np.array([w[1] for w in windows], dtype=np.float64)
+    start_idx = starts.astype(np.int64)
+    end_idx = ends.astype(np.int64)
     
     # 1. Speech hook score
-    speech_hook = detect_hook_phrases(transcript_words, start_s, end_s)
+    speech_hook = np.array([detect_hook_phrases(transcript, s, e) for s, e in windows])
     
     # 2. Motion score (average in window)
-    start_idx = int(start_s)
-    end_idx = int(end_s)
-    motion_score = float(np.mean(motion_scores[start_idx:end_idx])) if start_idx < len(motion_scores) else 0
+    motion = window_means(motion_scores, start_idx, end_idx)
     
     # 3. Audio peak score
-    audio_score = float(np.mean(audio_scores[start_idx:end_idx])) if start_idx < len(audio_scores) else 0
+    audio = window_means(audio_scores, start_idx, end_idx)
     
     # 4. Keyword match
-    segment_words = [w['word'].lower() for w in transcript_words if start_s <= w['start'] <= end_s]
-    keyword_score = sum(1 for kw in keywords if kw.lower() in ' '.join(segment_words))
-    keyword_score = min(keyword_score / max(len(keywords), 1), 1.0)
+    keyword_match = np.zeros(len(windows))
+    if keywords:
+        keyword_match = transcript.keyword_counts(keywords, starts, ends)
+        keyword_match = np.minimum(keyword_match / len(keywords), 1.0)
     
-    # 5. Scene freshness (penalize overlap)
-    overlap_penalty = 0.0
-    for ex_start, ex_end in existing_candidates:
-        overlap = min(end_s, ex_end) - max(start_s, ex_start)
-        if overlap > 0:
-            overlap_penalty += overlap / (end_s - start_s)
-    freshness = max(0, 1.0 - overlap_penalty)
+    # 5. Scene freshness (penalize overlap with earlier candidates)
+    freshness = np.maximum(0.0, 1.0 - overlap_penalties(starts, ends))
     
     # Weighted sum
-    total_score = (
+    total = (
         weights.get('speech_hook', 0.30) * speech_hook +
-        weights.get('motion', 0.25) * motion_score +
-        weights.get('audio_peak', 0.20) * audio_score +
-        weights.get('keyword_match', 0.15) * keyword_score +
+        weights.get('motion', 0.25) * motion +
+        weights.get('audio_peak', 0.20) * audio +
+        weights.get('keyword_match', 0.15) * keyword_match +
         weights.get('scene_freshness', 0.10) * freshness
     )
     
-    features = {
-        'speech_hook': speech_hook,
-        'motion': motion_score,
-        'audio_peak': audio_score,
-        'keyword_match': keyword_score,
-        'scene_freshness': freshness
-    }
+    return [
+        {
+            'start_s': start_s,
+            'end_s': end_s,
+            'score': float(total[i]),
+            'features': {
+                'speech_hook': float(speech_hook[i]),
+                'motion': float(motion[i]),
+                'audio_peak': float(audio[i]),
+                'keyword_match': float(keyword_match[i]),
+                'scene_freshness': float(freshness[i])
+            }
+        }
+        for i, (start_s, end_s) in enumerate(windows)
+    ]
+
+
+def create_thumbnail(video_path: str, work_dir: str, video_id: str, idx: int, cand: Dict) -> str:
+    """Extract a candidate's midpoint frame as a JPEG and upload it, returning its URL"""
+    thumb_time = (cand['start_s'] + cand['end_s']) / 2
+    thumb_path = os.path.join(work_dir, f"{video_id}_thumb_{idx}.jpg")
     
-    return total_score, features
+    # -ss before -i seeks on the input, so only the nearest GOP is decoded
+    cmd = [
+        'ffmpeg', '-ss', str(thumb_time), '-i', video_path,
+        '-vframes', '1', '-q:v', '2', '-y', thumb_path
+    ]
+    subprocess.run(cmd, check=True, capture_output=True)
+    
+    return upload_to_s3(thumb_path, f"thumbnails/{video_id}_{idx}.jpg")
 
 
 @celery_app.task(bind=True)
-def analyze_video_task(self: Task, job_id: str, video_id: str, config: Dict):
+def analyze_video_task(
+    self: Task,
+    job_id: str,
+    video_id: str,
+    config: Optional[Dict] = None,
+    config_key: Optional[str] = None
+):
+    """Analyze a video on a CPU worker (analysis queue)"""
+    return run_analysis(self, job_id, video_id, config, config_key)
+
+
+@celery_app.task(bind=True)
+def analyze_video_task_gpu(
+    self: Task,
+    job_id: str,
+    video_id: str,
+    config: Optional[Dict] = None,
+    config_key: Optional[str] = None
+):
+    """Analyze a video with Whisper on CUDA (analysis_gpu queue, one worker process per GPU)"""
+    return run_analysis(self, job_id, video_id, config, config_key, whisper_device='cuda')
+
+
+# Task the API enqueues: set ANALYSIS_GPU=1 when GPU workers serve analysis_gpu
+analysis_task = analyze_video_task_gpu if ANALYSIS_GPU else analyze_video_task
+
+
+def run_analysis(
+    self: Task,
+    job_id: str,
+    video_id: str,
+    config: Optional[Dict],
+    config_key: Optional[str] = None,
+    whisper_device: str = 'cpu'
+):
     """
     Main analysis task:
     1. Download video from S3
@@ -288,10 +496,22 @@ def analyze_video_task(self: Task, job_id: str, video_id: str, config: Dict):
     4. Generate and score candidates
     5. Create thumbnails
     6. Store results in DB
+    
+    Large configs arrive as config_key, an S3 object written by the API,
+    instead of inline in the broker message.
     """
     db = SessionLocal()
+    report_progress = ProgressReporter(self)
+    job = None
+    # Config object, scratch directory and cached-source lock, released however the task ends
+    resources = ExitStack()
     
     try:
+        if config_key:
+            config = get_json(config_key)
+            resources.callback(delete_from_s3, config_key)
+        config = {**config, 'whisper_device': whisper_device}
+        
         job = db.query(Job).filter(Job.id == job_id).first()
         video = db.query(Video).filter(Video.id == video_id).first()
         
@@ -303,24 +523,31 @@ def analyze_video_task(self: Task, job_id: str, video_id: str, config: Dict):
         job.progress = 0
         db.commit()
         
-        # Download video
-        self.update_state(state='PROGRESS', meta={'step': 'downloading', 'progress': 5})
-        video_path = f"/tmp/videos/{video_id}.mp4"
-        download_from_s3(video.src_url, video_path)
+        work_dir = make_scratch_dir(f"{video_id}_")
+        resources.callback(shutil.rmtree, work_dir, ignore_errors=True)
+        
+        # Stream the video from S3 (URL valid for the task's hard time limit), or
+        # download it into the video cache, where this node's renders reuse it
+        if ANALYSIS_STREAM_FROM_S3:
+            video_path = generate_stream_url(video.src_url, expires_in=celery_app.conf.task_time_limit)
+        else:
+            report_progress('downloading', 5)
+            video_path = resources.enter_context(video_cache.get_or_fetch(video_id, video.src_url))
         
         # Initialize analyzer
         analyzer = VideoAnalyzer(video_path, config)
         
         # Get video info
-        self.update_state(state='PROGRESS', meta={'step': 'analyzing_metadata', 'progress': 10})
+        report_progress('analyzing_metadata', 10)
         video_info = analyzer.get_video_info()
         video.duration = video_info['duration']
         video.resolution = video_info['resolution']
         db.commit()
+        invalidate_video_cache_sync(video.user_id, video_id)
         
         # Extract and transcribe audio
-        self.update_state(state='PROGRESS', meta={'step': 'transcribing', 'progress': 20})
-        audio_path = f"/tmp/videos/{video_id}.wav"
+        report_progress('transcribing', 20)
+        audio_path = os.path.join(work_dir, f"{video_id}.wav")
         analyzer.extract_audio(audio_path)
         transcript_data = analyzer.transcribe_audio(audio_path)
         
@@ -333,28 +560,27 @@ def analyze_video_task(self: Task, job_id: str, video_id: str, config: Dict):
         db.add(transcript)
         db.commit()
         
-        # Scene detection
-        self.update_state(state='PROGRESS', meta={'step': 'detecting_scenes', 'progress': 40})
-        scene_boundaries = analyzer.detect_scenes()
-        
-        # Motion analysis
-        self.update_state(state='PROGRESS', meta={'step': 'analyzing_motion', 'progress': 55})
-        motion_scores = analyzer.compute_motion_scores()
-        
-        # Audio peaks
-        self.update_state(state='PROGRESS', meta={'step': 'analyzing_audio', 'progress': 70})
-        audio_scores = analyzer.compute_audio_peaks(audio_path)
+        # Scene detection, motion analysis and audio peaks in parallel (the two
+        # video passes are separate FFmpeg processes; audio reads the WAV)
+        report_progress('analyzing_scenes_motion_audio', 40)
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            scenes_future = pool.submit(analyzer.detect_scenes)
+            motion_future = pool.submit(analyzer.compute_motion_scores)
+            audio_future = pool.submit(analyzer.compute_audio_peaks, audio_path)
+            scene_boundaries = scenes_future.result()
+            motion_scores = motion_future.result()
+            audio_scores = audio_future.result()
         
         # Generate candidates
-        self.update_state(state='PROGRESS', meta={'step': 'generating_candidates', 'progress': 80})
+        report_progress('generating_candidates', 80)
         min_duration = config.get('clip_min_s', 7)
         max_duration = config.get('clip_max_s', 15)
         target_duration = config.get('target_s', 10)
         keywords = config.get('keywords', [])
         weights = config.get('weights', {})
         
-        candidates = []
-        existing_segments = []
+        transcript_index = TranscriptIndex(transcript_data['words'])
+        windows = []
         
         # Generate candidates around scene boundaries and speech onsets
         for i in range(len(scene_boundaries) - 1):
@@ -371,52 +597,41 @@ def analyze_video_task(self: Task, job_id: str, video_id: str, config: Dict):
                 end_s = min(start_s + duration, scene_end, analyzer.duration)
                 
                 if end_s - start_s >= min_duration:
-                    score, features = score_candidate(
-                        start_s, end_s, transcript_data['words'],
-                        motion_scores, audio_scores, keywords,
-                        existing_segments, weights
-                    )
-                    
-                    candidates.append({
-                        'start_s': start_s,
-                        'end_s': end_s,
-                        'score': score,
-                        'features': features
-                    })
-                    existing_segments.append((start_s, end_s))
+                    windows.append((start_s, end_s))
+        
+        # Score all windows together
+        candidates = score_candidates(
+            windows, transcript_index, motion_scores, audio_scores, keywords, weights
+        )
         
         # Sort by score and keep top candidates
         candidates.sort(key=lambda x: x['score'], reverse=True)
         top_candidates = candidates[:config.get('max_candidates', 20)]
         
         # Create thumbnails and store candidates
-        self.update_state(state='PROGRESS', meta={'step': 'creating_thumbnails', 'progress': 90})
-        for idx, cand in enumerate(top_candidates):
-            # Extract thumbnail at midpoint
-            thumb_time = (cand['start_s'] + cand['end_s']) / 2
-            thumb_path = f"/tmp/videos/{video_id}_thumb_{idx}.jpg"
-            
-            cmd = [
-                'ffmpeg', '-ss', str(thumb_time), '-i', video_path,
-                '-vframes', '1', '-q:v', '2', '-y', thumb_path
-            ]
-            subprocess.run(cmd, check=True, capture_output=True)
-            
-            # Upload thumbnail
-            thumb_url = upload_to_s3(thumb_path, f"thumbnails/{video_id}_{idx}.jpg")
-            
-            # Store candidate
-            candidate = Candidate(
-                video_id=video_id,
-                start_s=cand['start_s'],
-                end_s=cand['end_s'],
-                score=cand['score'],
-                features=cand['features'],
-                thumb_url=thumb_url
-            )
-            db.add(candidate)
+        report_progress('creating_thumbnails', 90)
+        with ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS) as pool:
+            thumb_urls = list(pool.map(
+                lambda item: create_thumbnail(video_path, work_dir, video_id, *item),
+                enumerate(top_candidates)
+            ))
+        
+        # Store candidates in one multi-row INSERT
+        if top_candidates:
+            db.execute(insert(Candidate), [
+                {
+                    'video_id': video_id,
+                    'start_s': cand['start_s'],
+                    'end_s': cand['end_s'],
+                    'score': cand['score'],
+                    'features': cand['features'],
+                    'thumb_url': thumb_url
+                }
+                for cand, thumb_url in zip(top_candidates, thumb_urls)
+            ])
         
         db.commit()
+        invalidate_video_cache_sync(video.user_id, video_id)
         
         # Complete job
         job.status = 'completed'
@@ -424,16 +639,14 @@ def analyze_video_task(self: Task, job_id: str, video_id: str, config: Dict):
         job.logs = {'candidates_generated': len(top_candidates)}
         db.commit()
         
-        # Cleanup
-        os.remove(video_path)
-        os.remove(audio_path)
-        
         return {'status': 'completed', 'candidates': len(top_candidates)}
         
     except Exception as e:
-        job.status = 'failed'
-        job.logs = {'error': str(e)}
-        db.commit()
+        if job is not None:
+            job.status = 'failed'
+            job.logs = {'error': str(e)}
+            db.commit()
         raise
     finally:
+        resources.close()
         db.close()
\ No newline at end of file
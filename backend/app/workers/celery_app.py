@@ -1,5 +1,7 @@
-from celery import Celery
+from celery import Celery, Task
 import os
+import tempfile
+import time
 
 # Redis URL for broker and result backend
 REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
@@ -18,14 +20,16 @@ celery_app = Celery(
 # Celery configuration
 celery_app.conf.update(
     # Task settings
-    task_serializer='json',
-    accept_content=['json'],
-    result_serializer='json',
+    task_serializer='msgpack',
+    accept_content=['msgpack', 'json'],  # json: tasks queued before the switch
+    result_serializer='msgpack',
     timezone='UTC',
     enable_utc=True,
     
-    # Task routing
+    # Task routing (GPU workers: -Q analysis_gpu,rendering_gpu --concurrency=1 per GPU)
     task_routes={
+        'app.workers.analyzer.analyze_video_task_gpu': {'queue': 'analysis_gpu'},
+        'app.workers.renderer.render_clips_task_gpu': {'queue': 'rendering_gpu'},
         'app.workers.analyzer.*': {'queue': 'analysis'},
         'app.workers.renderer.*': {'queue': 'rendering'}
     },
@@ -35,7 +39,9 @@ celery_app.conf.update(
     task_time_limit=3900,  # 65 minutes hard limit
     task_soft_time_limit=3600,  # 60 minutes soft limit
     worker_prefetch_multiplier=1,  # Don't prefetch tasks
-    worker_max_tasks_per_child=50,  # Restart worker after N tasks
+    worker_max_tasks_per_child=50,  # Restart worker after N tasks (prefork only; solo GPU workers keep their model)
+    # Also recycle a child once its RSS passes this many KiB (checked after each task)
+    worker_max_memory_per_child=int(os.getenv("CELERY_MAX_MEMORY_PER_CHILD", "1500000")),
     
     # Result backend settings
     result_expires=86400,  # Results expire after 24 hours
@@ -50,12 +56,13 @@ celery_app.conf.update(
     
     # Performance settings
     worker_disable_rate_limits=True,
-    task_compression='gzip',
-    result_compression='gzip',
+    task_compression='zstd',
+    result_compression='zstd',
     
     # Monitoring
     worker_send_task_events=True,
-    task_send_sent_event=True,
+    # task-sent events double the publishes per submit; opt in if a dashboard needs them
+    task_send_sent_event=os.getenv("CELERY_SENT_EVENTS", "").lower() in ("1", "true", "yes"),
 )
 
 # Task priority levels
@@ -66,5 +73,48 @@ celery_app.conf.broker_transport_options = {
     'queue_order_strategy': 'priority'
 }
 
+# Task arguments larger than this (bytes of JSON) go to S3 and the message carries the key
+TASK_ARG_INLINE_LIMIT = int(os.getenv("TASK_ARG_INLINE_LIMIT", "16384"))
+
+# Parent of each task's scratch directory (FFmpeg outputs, audio, thumbnails).
+# Mount it on tmpfs to keep these files off disk; source videos are cached
+# separately under VIDEO_CACHE_DIR.
+SCRATCH_DIR = os.getenv("SCRATCH_DIR", "/tmp/videos/scratch")
+
+
+def make_scratch_dir(prefix: str) -> str:
+    """Create a private scratch directory for a task (the caller removes it with shutil.rmtree)"""
+    os.makedirs(SCRATCH_DIR, exist_ok=True)
+    return tempfile.mkdtemp(prefix=prefix, dir=SCRATCH_DIR)
+
+
+# Minimum seconds between PROGRESS updates (each is a result-backend write + event)
+PROGRESS_INTERVAL = 1.0
+
+
+class ProgressReporter:
+    """
+    Send a task's PROGRESS updates, throttling repeats of the same step
+    
+    A new step is always sent, so a fast task never sits on a stale one;
+    further updates within a step are dropped if they come within
+    PROGRESS_INTERVAL of the last one sent.
+    """
+    
+    def __init__(self, task: Task, interval: float = PROGRESS_INTERVAL):
+        self.task = task
+        self.interval = interval
+        self.last_sent = None
+        self.last_step = None
+    
+    def __call__(self, step: str, progress: int):
+        now = time.monotonic()
+        if step == self.last_step and now - self.last_sent < self.interval:
+            return
+        self.last_sent = now
+        self.last_step = step
+        self.task.update_state(state='PROGRESS', meta={'step': step, 'progress': progress})
+
+
 if __name__ == '__main__':
     celery_app.start()
\ No newline at end of file
@@ -1,25 +1,268 @@
 import os
+import re
+import shutil
 import subprocess
 import json
-from typing import List, Dict
-from celery import Task
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from operator import itemgetter
+from typing import List, Dict, Optional, Tuple
+from celery import Task, chord
 from sqlalchemy.orm import Session
 
-from app.workers.celery_app import celery_app
+from app.workers.celery_app import ProgressReporter, celery_app, make_scratch_dir
 from app.database import SessionLocal
 from app.models import Render, Candidate, Video, Transcript
-from app.services.s3_service import download_from_s3, upload_to_s3
+from app.services.s3_service import delete_from_s3, upload_stream_to_s3, upload_to_s3, video_cache
+from app.services.redis_service import release_active_renders_sync
+
+
+# Output frame size per aspect ratio
+ASPECT_SIZES = {
+    '9:16': (1080, 1920),
+    '1:1': (1080, 1080),
+    '4:5': (1080, 1350),
+}
+
+# Encoder for the rendering queue: none (libx264), nvenc or vaapi. GPU workers
+# on the rendering_gpu queue always use nvenc.
+RENDER_HWACCEL = os.getenv("RENDER_HWACCEL", "none")
+VAAPI_DEVICE = os.getenv("VAAPI_DEVICE", "/dev/dri/renderD128")
+
+# Pipe FFmpeg output straight into S3 multipart uploads instead of /tmp. Piped
+# MP4s must be fragmented (no faststart moov), so this is opt-in.
+RENDER_STREAM_TO_S3 = os.getenv("RENDER_STREAM_TO_S3", "").lower() in ("1", "true", "yes")
+
+# Queue for uploading rendered files (e.g. 'io', served by a gevent pool) so
+# prefork render slots don't sit on S3 uploads. Its workers must share
+# SCRATCH_DIR with the render workers. Unset: clip tasks upload their own files.
+RENDER_UPLOAD_QUEUE = os.getenv("RENDER_UPLOAD_QUEUE")
+
+# Task the API enqueues: set RENDER_GPU=1 when GPU workers serve rendering_gpu
+RENDER_GPU = os.getenv("RENDER_GPU", "").lower() in ("1", "true", "yes")
+
+# x264 frame threads per encoder (0 = auto, ~1.5x cores). A clip runs one
+# encoder per aspect, so a node uses about concurrency x aspects x threads;
+# on shared nodes set this to cores / (worker concurrency x aspects).
+X264_THREADS = os.getenv("X264_THREADS", "0")
+
+# x264 settings per encode profile: (options, extra x264-params). Platforms
+# re-encode uploads anyway, so 'fast' trades a little CRF for a much cheaper
+# encode (fewer refs/b-frames, shorter lookahead).
+X264_PROFILES = {
+    'fast': (['-preset', 'veryfast', '-crf', '24', '-tune', 'fastdecode'], 'rc-lookahead=10:ref=1:bframes=2'),
+    'balanced': (['-preset', 'fast', '-crf', '23'], 'rc-lookahead=20'),
+    'quality': (['-preset', 'medium', '-crf', '21'], ''),
+}
+RENDER_ENCODE_PROFILE = os.getenv("RENDER_ENCODE_PROFILE", "fast")
+
+
+def x264_encode_args(profile: str) -> List[str]:
+    """libx264 output options for an encode profile (fixed 60-frame GOP)"""
+    options, x264_params = X264_PROFILES[profile]
+    return [
+        '-c:v', 'libx264',
+        *options,
+        '-profile:v', 'high',
+        '-pix_fmt', 'yuv420p',
+        '-g', '60',
+        '-threads', X264_THREADS,
+        '-x264-params', ':'.join(filter(None, ['sliced-threads=0:aq-mode=1', x264_params])),
+    ]
+
+# Hardware pipelines: frames are decoded and scaled on the GPU, then downloaded
+# for crop/drawtext (CPU-only filters) and handed back to the hardware encoder
+HWACCEL_PIPELINES = {
+    'nvenc': {
+        'input': ['-hwaccel', 'cuda', '-hwaccel_output_format', 'cuda'],
+        'scale': 'scale_cuda={width}:{height}:force_original_aspect_ratio=increase,hwdownload,format=nv12',
+        'upload': '',  # h264_nvenc uploads system-memory frames itself
+        'encode': [
+            '-c:v', 'h264_nvenc',
+            '-preset', 'p4',
+            '-tune', 'hq',
+            '-rc', 'vbr',
+            '-cq', '23',
+            '-b:v', '0',
+            '-profile:v', 'high',
+        ],
+    },
+    'vaapi': {
+        'input': ['-hwaccel', 'vaapi', '-hwaccel_output_format', 'vaapi', '-vaapi_device', VAAPI_DEVICE],
+        'scale': 'scale_vaapi=w={width}:h={height}:force_original_aspect_ratio=increase,hwdownload,format=nv12',
+        'upload': ',format=nv12,hwupload',
+        'encode': [
+            '-c:v', 'h264_vaapi',
+            '-qp', '23',
+            '-profile:v', 'high',
+        ],
+    },
+}
+
+
+FONTS_DIR = '/usr/share/fonts/truetype/dejavu'
+
+# Filter graphs longer than this are passed with -filter_complex_script
+FILTER_SCRIPT_THRESHOLD = 8 * 1024
+
+# libass style per caption template: font size, primary, secondary, outline and
+# shadow colours (&HAABBGGRR, alpha 00 = opaque), outline and shadow widths
+ASS_STYLES = {
+    'clean': (48, '&H00FFFFFF', '&H00FFFFFF', '&H00000000', '&H80000000', 3, 2),
+    'manga': (56, '&H0000FFFF', '&H0000FFFF', '&H00000000', '&H33000000', 4, 3),
+    'impact': (50, '&H00FFFFFF', '&H00FFFFFF', '&H00000000', '&H4D000000', 4, 3),
+    # Karaoke words fill from secondary (gray) to primary (yellow)
+    'karaoke': (48, '&H0000FFFF', '&H00808080', '&H00000000', '&H80000000', 3, 2),
+}
+
+
+def _ass_time(seconds: float) -> str:
+    """Format seconds as an ASS timestamp (H:MM:SS.cc)"""
+    cs = max(0, round(seconds * 100))
+    hours, cs = divmod(cs, 360000)
+    minutes, cs = divmod(cs, 6000)
+    secs, cs = divmod(cs, 100)
+    return f"{hours}:{minutes:02d}:{secs:02d}.{cs:02d}"
+
+
+def _ass_text(word: str) -> str:
+    """Make a word safe for an ASS Dialogue line (braces start override tags)"""
+    return word.replace('\\', '/').replace('{', '(').replace('}', ')').replace('\n', ' ')
+
+
+# Bytes of FFmpeg stderr kept for error messages
+FFMPEG_STDERR_TAIL = 8192
+
+
+def _stderr_tail(stream, limit: int = FFMPEG_STDERR_TAIL) -> str:
+    """Drain a process's stderr to EOF, keeping only the last `limit` bytes"""
+    tail = b''
+    for chunk in iter(lambda: stream.read(65536), b''):
+        tail = (tail + chunk)[-limit:]
+    return tail.decode(errors='replace')
+
+
+# Longer drawtext strings are passed with textfile= instead of text=
+DRAWTEXT_INLINE_LIMIT = 40
+
+
+def _filter_escape(value: str) -> str:
+    """
+    Quote a filter option value so FFmpeg reads it back verbatim
+    
+    The option parser unescapes \\, ', : and whitespace (which it would
+    otherwise trim) with backslashes; the graph parser then needs the result
+    quoted so , ; [ ] stay literal (a quote itself has to close the quoting,
+    be backslash-escaped and reopen it).
+    """
+    escaped = re.sub(r"([\\':\s])", r"\\\1", value)
+    return "'" + escaped.replace("'", "'\\''") + "'"
+
+
+# Clips needing no video filtering are stream-copied when a keyframe lies
+# within this many seconds of the start
+KEYFRAME_SNAP_TOLERANCE = float(os.getenv("KEYFRAME_SNAP_TOLERANCE", "0.25"))
+
+# probe_stream results in this worker process, keyed by (path, inode) so a
+# re-fetched source is probed again
+_PROBE_CACHE: Dict[Tuple[str, int], Dict] = {}
+_PROBE_CACHE_SIZE = 32
+
+
+def probe_stream(video_path: str) -> Dict:
+    """Codec and frame size of a video's first video stream (from its header, cached per worker process)"""
+    key = (video_path, os.stat(video_path).st_ino)
+    info = _PROBE_CACHE.get(key)
+    if info is None:
+        cmd = [
+            'ffprobe', '-v', 'error', '-select_streams', 'v:0',
+            '-show_entries', 'stream=codec_name,width,height',
+            '-of', 'json', video_path
+        ]
+        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+        stream = json.loads(result.stdout)['streams'][0]
+        info = {'codec': stream['codec_name'], 'size': (stream['width'], stream['height'])}
+        
+        if len(_PROBE_CACHE) >= _PROBE_CACHE_SIZE:
+            _PROBE_CACHE.clear()
+        _PROBE_CACHE[key] = info
+    
+    return info
+
+
+def probe_keyframes(video_path: str, start_s: float, end_s: float) -> List[float]:
+    """
+    Sorted keyframe times of a video's first video stream between start_s and end_s
+    
+    Only packet flags in that interval are read (ffprobe seeks to it and
+    decodes nothing), so the cost doesn't grow with the source's length.
+    """
+    cmd = [
+        'ffprobe', '-v', 'error', '-select_streams', 'v:0',
+        '-read_intervals', f'{max(start_s, 0)}%{end_s}',
+        '-show_entries', 'packet=pts_time,flags',
+        '-of', 'json', video_path
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    return sorted(
+        float(packet['pts_time'])
+        for packet in json.loads(result.stdout).get('packets', [])
+        if packet.get('flags', '').startswith('K') and packet.get('pts_time', 'N/A') != 'N/A'
+    )
 
 
 class TemplateRenderer:
     """Handles different caption templates and styling"""
     
-    def __init__(self, video_path: str, output_path: str, config: Dict):
+    def __init__(self, video_path: str, output_prefix: str, config: Dict):
         self.video_path = video_path
-        self.output_path = output_path
+        self.output_prefix = output_prefix
         self.config = config
-        self.watermark = config.get('watermark', '@myanime')
+        self.watermark = config.get('watermark') or ''
         self.loudness = config.get('loudness', '-14')
+        self.pipeline = HWACCEL_PIPELINES.get(config.get('hwaccel', 'none'))
+        self.encode_profile = config.get('encode_profile', RENDER_ENCODE_PROFILE)
+        self.temp_paths = []
+    
+    def output_path(self, aspect: str) -> str:
+        """Local path of the rendered file for an aspect ratio"""
+        return f"{self.output_prefix}_{aspect.replace(':', 'x')}.mp4"
+    
+    def stream_copy_start(
+        self,
+        start_s: float,
+        captions: List[Dict],
+        template: str,
+        aspects: List[str]
+    ) -> Optional[float]:
+        """
+        Keyframe time to cut from if the clip can be stream-copied, else None
+        
+        That needs a clip with no zoom, captions or watermark, an H.264 source
+        already at every output's frame size, and a keyframe within
+        KEYFRAME_SNAP_TOLERANCE of the start.
+        """
+        if template == 'manga' or self.watermark or (captions and template in ASS_STYLES):
+            return None
+        
+        try:
+            # The header probe rules out most sources before any packets are read
+            info = probe_stream(self.video_path)
+            if info['codec'] != 'h264' or any(ASPECT_SIZES[aspect] != info['size'] for aspect in aspects):
+                return None
+            
+            keyframes = probe_keyframes(
+                self.video_path,
+                start_s - KEYFRAME_SNAP_TOLERANCE,
+                start_s + KEYFRAME_SNAP_TOLERANCE
+            )
+        except (subprocess.CalledProcessError, LookupError, ValueError):
+            return None
+        
+        nearest = min(keyframes, key=lambda t: abs(t - start_s), default=None)
+        if nearest is None or abs(nearest - start_s) > KEYFRAME_SNAP_TOLERANCE:
+            return None
+        return nearest
     
     def build_ffmpeg_command(
         self,
@@ -27,86 +270,149 @@ class TemplateRenderer:
         end_s: float,
         captions: List[Dict],
         template: str,
-        aspect: str
+        aspects: List[str],
+        output_fds: Optional[Dict[str, int]] = None
     ) -> List[str]:
-        """Build FFmpeg command with filters for specified template"""
+        """
+        Build one FFmpeg command rendering every aspect ratio
         
-        duration = end_s - start_s
+        The segment is decoded and loudness-normalized once, then split into
+        one filter chain and encoder per aspect. With config['hwaccel'] set,
+        decode, scaling and encoding run on the GPU. output_fds writes each
+        aspect as fragmented MP4 to a pipe instead of its output path.
         
-        # Base command
-        cmd = [
-            'ffmpeg', '-ss', str(start_s), '-i', self.video_path,
-            '-t', str(duration)
-        ]
+        Clips that need no video filtering and start on a keyframe skip all
+        of that (see stream_copy_start and build_copy_command).
+        """
         
-        # Build filter complex
-        filters = []
+        copy_start = self.stream_copy_start(start_s, captions, template, aspects)
+        if copy_start is not None:
+            return self.build_copy_command(copy_start, end_s, aspects, output_fds)
         
-        # 1. Video scaling and cropping for aspect ratio
-        if aspect == '9:16':
-            filters.append(
-                '[0:v]scale=1080:1920:force_original_aspect_ratio=increase,'
-                'crop=1080:1920'
-            )
-        elif aspect == '1:1':
-            filters.append(
-                '[0:v]scale=1080:1080:force_original_aspect_ratio=increase,'
-                'crop=1080:1080'
-            )
-        elif aspect == '4:5':
-            filters.append(
-                '[0:v]scale=1080:1350:force_original_aspect_ratio=increase,'
-                'crop=1080:1350'
-            )
+        duration = end_s - start_s
+        pipeline = self.pipeline
+        
+        # Base command (-t before -i limits the input, so it applies to every output)
+        cmd = ['ffmpeg', '-hide_banner', '-nostats', '-loglevel', 'error']
+        if pipeline:
+            cmd.extend(pipeline['input'])
+        cmd.extend([
+            '-ss', str(start_s), '-t', str(duration),
+            '-i', self.video_path
+        ])
+        
+        # Build filter complex: decode once, fan out to one chain per aspect
+        count = len(aspects)
+        filters = [
+            '[0:v]split={}{}'.format(count, ''.join(f'[s{i}]' for i in range(count))),
+            f'[0:a]{self.audio_filter()},'
+            'asplit={}{}'.format(count, ''.join(f'[a{i}]' for i in range(count)))
+        ]
         
-        # 2. Optional subtle zoom (for manga template)
-        if template == 'manga':
-            filters[-1] += ',zoompan=z=\'min(zoom+0.0005,1.05)\':d=1:x=\'iw/2-(iw/zoom/2)\':y=\'ih/2-(ih/zoom/2)\':s=1080x1920'
+        # Long watermarks go through a text file rather than the filter graph
+        if len(self.watermark) > DRAWTEXT_INLINE_LIMIT:
+            text_path = f"{self.output_prefix}.watermark.txt"
+            with open(text_path, 'w', encoding='utf-8') as f:
+                f.write(self.watermark)
+            self.temp_paths.append(text_path)
+            text_option = f"textfile={_filter_escape(text_path)}"
+        else:
+            text_option = f"text={_filter_escape(self.watermark)}"
         
-        # 3. Add watermark
         watermark_filter = (
-            f"drawtext=text='{self.watermark}':"
+            f"drawtext={text_option}:expansion=none:"
             f"fontsize=24:fontcolor=white@0.6:"
             f"x=20:y=20:shadowcolor=black@0.5:shadowx=2:shadowy=2"
         )
-        filters[-1] += f',{watermark_filter}'
         
-        # 4. Add captions based on template
-        caption_filter = self.build_caption_filter(captions, template, aspect, start_s)
-        if caption_filter:
-            filters[-1] += f',{caption_filter}'
-        
-        filters[-1] += '[v]'
-        
-        # 5. Audio normalization
-        audio_filter = (
-            f'[0:a]loudnorm=I={self.loudness}:TP=-1:LRA=11,'
-            f'aformat=sample_rates=48000[a]'
-        )
-        filters.append(audio_filter)
+        for i, aspect in enumerate(aspects):
+            # 1. Video scaling and cropping for aspect ratio
+            width, height = ASPECT_SIZES[aspect]
+            if pipeline:
+                chain = f"[s{i}]{pipeline['scale'].format(width=width, height=height)},crop={width}:{height}"
+            else:
+                chain = (
+                    f'[s{i}]scale={width}:{height}:force_original_aspect_ratio=increase,'
+                    f'crop={width}:{height}'
+                )
+            
+            # 2. Optional subtle zoom (for manga template)
+            if template == 'manga':
+                chain += ',zoompan=z=\'min(zoom+0.0005,1.05)\':d=1:x=\'iw/2-(iw/zoom/2)\':y=\'ih/2-(ih/zoom/2)\':s=1080x1920'
+            
+            # 3. Add watermark
+            if self.watermark:
+                chain += f',{watermark_filter}'
+            
+            # 4. Add captions based on template
+            caption_filter = self.build_caption_filter(captions, template, aspect, start_s)
+            if caption_filter:
+                chain += f',{caption_filter}'
+            
+            if pipeline:
+                chain += pipeline['upload']
+            
+            filters.append(f'{chain}[v{i}]')
+        
+        # Add filter complex to command (from a file if it would bloat argv)
+        filter_graph = ';'.join(filters)
+        if len(filter_graph) > FILTER_SCRIPT_THRESHOLD:
+            script_path = f"{self.output_prefix}.fg"
+            with open(script_path, 'w', encoding='utf-8') as f:
+                f.write(filter_graph)
+            self.temp_paths.append(script_path)
+            cmd.extend(['-filter_complex_script', script_path])
+        else:
+            cmd.extend(['-filter_complex', filter_graph])
+        
+        # One mapped output with its own encoding settings per aspect
+        encode_args = pipeline['encode'] if pipeline else x264_encode_args(self.encode_profile)
+        for i, aspect in enumerate(aspects):
+            cmd.extend(['-map', f'[v{i}]', '-map', f'[a{i}]', *encode_args])
+            cmd.extend(['-c:a', 'aac', '-b:a', '128k', *self.output_args(aspect, output_fds)])
         
-        # Add filter complex to command
-        cmd.extend(['-filter_complex', ';'.join(filters)])
+        return cmd
+    
+    def build_copy_command(
+        self,
+        start_s: float,
+        end_s: float,
+        aspects: List[str],
+        output_fds: Optional[Dict[str, int]] = None
+    ) -> List[str]:
+        """
+        Build an FFmpeg command cutting the clip without re-encoding the video
         
-        # Map outputs
-        cmd.extend(['-map', '[v]', '-map', '[a]'])
+        start_s must be a keyframe; only the (loudness-normalized) audio is
+        encoded.
+        """
+        cmd = [
+            'ffmpeg', '-hide_banner', '-nostats', '-loglevel', 'error',
+            '-ss', str(start_s), '-t', str(end_s - start_s),
+            '-i', self.video_path
+        ]
         
-        # Encoding settings
-        cmd.extend([
-            '-c:v', 'libx264',
-            '-preset', 'fast',
-            '-crf', '23',
-            '-profile:v', 'high',
-            '-pix_fmt', 'yuv420p',
-            '-movflags', '+faststart',
-            '-c:a', 'aac',
-            '-b:a', '128k',
-            '-y',
-            self.output_path
-        ])
+        for aspect in aspects:
+            cmd.extend(['-map', '0:v:0', '-map', '0:a:0', '-c:v', 'copy'])
+            cmd.extend(['-af', self.audio_filter(), '-c:a', 'aac', '-b:a', '128k'])
+            cmd.extend(self.output_args(aspect, output_fds))
         
         return cmd
     
+    def audio_filter(self) -> str:
+        """Loudness normalization applied to every output's audio"""
+        return f'loudnorm=I={self.loudness}:TP=-1:LRA=11,aformat=sample_rates=48000'
+    
+    def output_args(self, aspect: str, output_fds: Optional[Dict[str, int]] = None) -> List[str]:
+        """Muxer options and destination for one aspect: a pipe (fragmented MP4) or its output path"""
+        if output_fds:
+            return [
+                '-f', 'mp4',
+                '-movflags', '+frag_keyframe+empty_moov+default_base_moof',
+                f'pipe:{output_fds[aspect]}'
+            ]
+        return ['-movflags', '+faststart', '-y', self.output_path(aspect)]
+    
     def build_caption_filter(
         self,
         captions: List[Dict],
@@ -114,182 +420,230 @@ class TemplateRenderer:
         aspect: str,
         video_start: float
     ) -> str:
-        """Build drawtext filter for captions based on template"""
+        """Write the captions as an ASS script and return the subtitles filter drawing it"""
         
-        if not captions:
+        if not captions or template not in ASS_STYLES:
             return ''
         
+        ass_path = self._write_ass(captions, template, aspect, video_start)
+        return f"subtitles=filename={_filter_escape(ass_path)}:fontsdir={FONTS_DIR}"
+    
+    def _write_ass(
+        self,
+        captions: List[Dict],
+        template: str,
+        aspect: str,
+        video_start: float
+    ) -> str:
+        """
+        Write an ASS subtitle script for one aspect ratio
+        
+        libass draws every caption in a single filter pass with cached
+        glyphs, instead of one drawtext per word.
+        """
+        width, height = ASPECT_SIZES[aspect]
+        
         # Safe zone calculations (avoid bottom 250px for TikTok UI)
         if aspect == '9:16':
             safe_y = 1920 - 300  # 300px from bottom
-            width = 1080
         elif aspect == '1:1':
             safe_y = 1080 - 200
-            width = 1080
         else:  # 4:5
             safe_y = 1350 - 250
-            width = 1080
-        
-        if template == 'clean':
-            return self._build_clean_captions(captions, safe_y, width, video_start)
-        elif template == 'manga':
-            return self._build_manga_captions(captions, safe_y, width, video_start)
-        elif template == 'impact':
-            return self._build_impact_captions(captions, safe_y, width, video_start)
-        elif template == 'karaoke':
-            return self._build_karaoke_captions(captions, safe_y, width, video_start)
-        
-        return ''
-    
-    def _build_clean_captions(self, captions: List[Dict], y: int, width: int, start: float) -> str:
-        """Clean subtitle style with outline and shadow"""
-        filters = []
-        
-        for cap in captions:
-            # Adjust timing relative to clip start
-            enable_start = cap['start'] - start
-            enable_end = cap['end'] - start
-            
-            text = cap['word'].replace("'", "\\'").replace(":", "\\:")
-            
-            filter_part = (
-                f"drawtext=text='{text}':"
-                f"fontfile=/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf:"
-                f"fontsize=48:fontcolor=white:"
-                f"borderw=3:bordercolor=black:"
-                f"x=(w-text_w)/2:y={y}:"
-                f"shadowcolor=black@0.5:shadowx=2:shadowy=2:"
-                f"enable='between(t,{enable_start},{enable_end})'"
-            )
-            filters.append(filter_part)
         
-        return ','.join(filters)
-    
-    def _build_manga_captions(self, captions: List[Dict], y: int, width: int, start: float) -> str:
-        """Manga/comic style with bold font"""
-        filters = []
-        
-        for cap in captions:
-            enable_start = cap['start'] - start
-            enable_end = cap['end'] - start
-            text = cap['word'].replace("'", "\\'").replace(":", "\\:")
-            
-            filter_part = (
-                f"drawtext=text='{text}':"
-                f"fontfile=/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf:"
-                f"fontsize=56:fontcolor=yellow:"
-                f"borderw=4:bordercolor=black:"
-                f"x=(w-text_w)/2:y={y}:"
-                f"shadowcolor=black@0.8:shadowx=3:shadowy=3:"
-                f"enable='between(t,{enable_start},{enable_end})'"
-            )
-            filters.append(filter_part)
+        fontsize, primary, secondary, outline_colour, shadow_colour, outline, shadow = ASS_STYLES[template]
+        
+        # Top-centre alignment (8) with MarginV puts the text top at safe_y
+        lines = [
+            '[Script Info]',
+            'ScriptType: v4.00+',
+            f'PlayResX: {width}',
+            f'PlayResY: {height}',
+            'WrapStyle: 2',
+            '',
+            '[V4+ Styles]',
+            'Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, '
+            'Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, '
+            'Shadow, Alignment, MarginL, MarginR, MarginV, Encoding',
+            f'Style: Default,DejaVu Sans,{fontsize},{primary},{secondary},{outline_colour},{shadow_colour},'
+            f'-1,0,0,0,100,100,0,0,1,{outline},{shadow},8,0,0,{safe_y},1',
+            '',
+            '[Events]',
+            'Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text',
+        ]
         
-        return ','.join(filters)
-    
-    def _build_impact_captions(self, captions: List[Dict], y: int, width: int, start: float) -> str:
-        """Impact text with word-by-word pop-in effect"""
-        filters = []
+        for start, end, text in self._ass_events(captions, template, width, safe_y, video_start):
+            lines.append(f'Dialogue: 0,{_ass_time(start)},{_ass_time(end)},Default,,0,0,0,,{text}')
+        
+        ass_path = f"{self.output_prefix}_{aspect.replace(':', 'x')}.ass"
+        with open(ass_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        self.temp_paths.append(ass_path)
         
-        # Group into phrases for emphasis
+        return ass_path
+    
+    def _ass_events(
+        self,
+        captions: List[Dict],
+        template: str,
+        width: int,
+        y: int,
+        start: float
+    ) -> List[Tuple[float, float, str]]:
+        """(start, end, text) dialogue events for a template, timed relative to the clip"""
+        
+        if template == 'karaoke':
+            # One line for the whole clip; \k tags fill each word from gray to
+            # yellow as it is spoken (gaps between words get an empty \k)
+            parts = []
+            cursor = 0.0
+            for cap in captions:
+                word_start = cap['start'] - start
+                word_end = cap['end'] - start
+                if word_start > cursor:
+                    parts.append(f'{{\\k{round((word_start - cursor) * 100)}}}')
+                    cursor = word_start
+                parts.append(f'{{\\k{round((word_end - cursor) * 100)}}}{_ass_text(cap["word"])} ')
+                cursor = max(cursor, word_end)
+            return [(0.0, cursor, ''.join(parts).rstrip())]
+        
+        events = []
         for i, cap in enumerate(captions):
-            enable_start = cap['start'] - start
-            enable_end = cap['end'] - start
-            text = cap['word'].replace("'", "\\'").replace(":", "\\:")
+            text = _ass_text(cap['word'])
             
-            # Emphasize nouns/verbs (simplified: just cap first letter check)
-            is_emphasized = cap['word'][0].isupper() if cap['word'] else False
-            fontsize = 60 if is_emphasized else 50
-            fontcolor = 'red' if is_emphasized else 'white'
+            if template == 'impact':
+                # Emphasize nouns/verbs (simplified: just cap first letter check)
+                is_emphasized = cap['word'][0].isupper() if cap['word'] else False
+                override = f'\\pos({width // 2},{y - i*10})'  # Slight vertical offset per word
+                if is_emphasized:
+                    override += '\\fs60\\c&H0000FF&'
+                text = f'{{{override}}}{text}'
             
-            filter_part = (
-                f"drawtext=text='{text}':"
-                f"fontfile=/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf:"
-                f"fontsize={fontsize}:fontcolor={fontcolor}:"
-                f"borderw=4:bordercolor=black:"
-                f"x=(w-text_w)/2:y={y - i*10}:"  # Slight vertical offset per word
-                f"shadowcolor=black@0.7:shadowx=3:shadowy=3:"
-                f"enable='between(t,{enable_start},{enable_end})'"
-            )
-            filters.append(filter_part)
+            events.append((cap['start'] - start, cap['end'] - start, text))
         
-        return ','.join(filters)
+        return events
     
-    def _build_karaoke_captions(self, captions: List[Dict], y: int, width: int, start: float) -> str:
-        """Karaoke style with progressive word highlight"""
-        filters = []
-        
-        # Build full text line
-        full_text = ' '.join(cap['word'] for cap in captions)
-        full_text = full_text.replace("'", "\\'").replace(":", "\\:")
-        
-        # Base text (unhighlighted)
-        base_filter = (
-            f"drawtext=text='{full_text}':"
-            f"fontfile=/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf:"
-            f"fontsize=48:fontcolor=gray:"
-            f"borderw=3:bordercolor=black:"
-            f"x=(w-text_w)/2:y={y}:"
-            f"shadowcolor=black@0.5:shadowx=2:shadowy=2"
-        )
-        filters.append(base_filter)
-        
-        # Highlighted words (overlay)
-        for cap in captions:
-            enable_start = cap['start'] - start
-            enable_end = cap['end'] - start
-            text = cap['word'].replace("'", "\\'").replace(":", "\\:")
+    def render(
+        self,
+        start_s: float,
+        end_s: float,
+        captions: List[Dict],
+        template: str,
+        aspects: List[str]
+    ) -> Dict[str, str]:
+        """Execute FFmpeg render, returning {aspect: output path}"""
+        try:
+            cmd = self.build_ffmpeg_command(start_s, end_s, captions, template, aspects)
             
-            highlight_filter = (
-                f"drawtext=text='{text}':"
-                f"fontfile=/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf:"
-                f"fontsize=48:fontcolor=yellow:"
-                f"borderw=3:bordercolor=black:"
-                f"x=(w-text_w)/2:y={y}:"
-                f"shadowcolor=black@0.5:shadowx=2:shadowy=2:"
-                f"enable='between(t,{enable_start},{enable_end})'"
+            # Run FFmpeg, keeping only the tail of its log
+            proc = subprocess.Popen(
+                cmd,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE
             )
-            filters.append(highlight_filter)
+            stderr = _stderr_tail(proc.stderr)
+            proc.wait()
+        finally:
+            self._remove_temp_files()
+        
+        if proc.returncode != 0:
+            raise RuntimeError(f"FFmpeg failed: {stderr}")
         
-        return ','.join(filters)
+        return {aspect: self.output_path(aspect) for aspect in aspects}
     
-    def render(
+    def render_to_s3(
         self,
         start_s: float,
         end_s: float,
         captions: List[Dict],
         template: str,
-        aspect: str
-    ):
-        """Execute FFmpeg render"""
-        cmd = self.build_ffmpeg_command(start_s, end_s, captions, template, aspect)
-        
-        # Run FFmpeg
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True
-        )
-        
-        if result.returncode != 0:
-            raise RuntimeError(f"FFmpeg failed: {result.stderr}")
-        
-        return self.output_path
+        aspects: List[str],
+        s3_prefix: str
+    ) -> Dict[str, str]:
+        """
+        Render with each output piped into its own S3 multipart upload
+        
+        Encoding and uploading overlap and nothing is written to /tmp.
+        Returns {aspect: S3 URL}; partial uploads are deleted if FFmpeg fails.
+        """
+        read_fds, write_fds = {}, {}
+        for aspect in aspects:
+            read_fds[aspect], write_fds[aspect] = os.pipe()
+        
+        def upload(aspect: str) -> str:
+            # Closing the read end on failure makes FFmpeg exit with EPIPE instead of blocking
+            with os.fdopen(read_fds[aspect], 'rb') as stream:
+                s3_key = f"{s3_prefix}/{os.path.basename(self.output_path(aspect))}"
+                return upload_stream_to_s3(stream, s3_key, 'video/mp4')
+        
+        try:
+            cmd = self.build_ffmpeg_command(start_s, end_s, captions, template, aspects, write_fds)
+            proc = subprocess.Popen(
+                cmd,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+                pass_fds=list(write_fds.values())
+            )
+        except Exception:
+            for fd in [*read_fds.values(), *write_fds.values()]:
+                os.close(fd)
+            self._remove_temp_files()
+            raise
+        
+        # Only FFmpeg holds the write ends now, so uploads see EOF when it exits
+        for fd in write_fds.values():
+            os.close(fd)
+        
+        try:
+            with ThreadPoolExecutor(max_workers=len(aspects)) as pool:
+                futures = {aspect: pool.submit(upload, aspect) for aspect in aspects}
+                stderr = _stderr_tail(proc.stderr)
+                proc.wait()
+        finally:
+            self._remove_temp_files()
+        
+        urls = {aspect: future.result() for aspect, future in futures.items() if future.exception() is None}
+        if proc.returncode != 0 or len(urls) != len(aspects):
+            for url in urls.values():
+                delete_from_s3(url)
+            # An upload error is the root cause if it made FFmpeg hit EPIPE
+            for future in futures.values():
+                future.result()
+            raise RuntimeError(f"FFmpeg failed: {stderr}")
+        
+        return urls
+    
+    def _remove_temp_files(self):
+        """Delete subtitle and filter scripts once FFmpeg has exited"""
+        for path in self.temp_paths:
+            os.remove(path)
+        self.temp_paths = []
 
 
 @celery_app.task(bind=True)
 def render_clips_task(self: Task, render_id: str, params: Dict):
+    """Start a render whose clips run on CPU workers (rendering queue, encoder from RENDER_HWACCEL)"""
+    return start_render(render_id, params, gpu=False)
+
+
+@celery_app.task(bind=True)
+def render_clips_task_gpu(self: Task, render_id: str, params: Dict):
+    """Start a render whose clips run with NVDEC/NVENC (rendering_gpu queue)"""
+    return start_render(render_id, params, gpu=True)
+
+
+render_task = render_clips_task_gpu if RENDER_GPU else render_clips_task
+
+
+def start_render(render_id: str, params: Dict, gpu: bool = False):
     """
     Render task:
-    1. Download source video
-    2. Get candidate details and transcripts
-    3. For each candidate + aspect ratio:
-       - Apply template
-       - Add captions from Whisper timestamps
-       - Normalize audio
-       - Add watermark
-    4. Upload rendered files to S3
-    5. Update render record
+    1. Mark the render as processing
+    2. Fan out one render_clip_task per candidate as a chord, so clips
+       render in parallel across the worker pool (each chained to an
+       upload_clip_task on RENDER_UPLOAD_QUEUE when set)
+    3. finalize_render_task collects the uploaded files and completes the
+       render; fail_render_task marks it failed if any clip fails
     """
     db = SessionLocal()
     
@@ -301,88 +655,197 @@ def render_clips_task(self: Task, render_id: str, params: Dict):
         render.status = 'processing'
         db.commit()
         
+        # Clips (and the callback) stay on the queue of the workers that can encode them
+        queue = 'rendering_gpu' if gpu else 'rendering'
+        offload_uploads = bool(RENDER_UPLOAD_QUEUE) and not RENDER_STREAM_TO_S3
+        clips = []
+        for cand_id in params['candidate_ids']:
+            clip = render_clip_task.s(render_id, cand_id, params, gpu, not offload_uploads).set(queue=queue)
+            if offload_uploads:
+                clip = clip | upload_clip_task.s(render_id).set(queue=RENDER_UPLOAD_QUEUE)
+            clips.append(clip)
+        finalize = finalize_render_task.s(render_id).set(queue=queue)
+        chord(clips)(finalize.on_error(fail_render_task.s(render_id)))
+        
+        return {'status': 'processing', 'clips': len(clips)}
+        
+    except Exception as e:
+        render.status = 'failed'
+        render.files = {'error': str(e)}
+        db.commit()
+        release_active_renders_sync(render.user_id)
+        raise
+    finally:
+        db.close()
+
+
+@celery_app.task(bind=True)
+def render_clip_task(
+    self: Task,
+    render_id: str,
+    cand_id: str,
+    params: Dict,
+    gpu: bool = False,
+    upload: bool = True
+):
+    """
+    Render one candidate in every requested aspect ratio:
+    1. Download source video (or reuse this worker's cached copy)
+    2. Get candidate details and transcripts
+    3. Render all aspect ratios in one FFmpeg pass:
+       - Apply template
+       - Add captions from Whisper timestamps
+       - Normalize audio
+       - Add watermark
+    4. Upload rendered files to S3 (unless upload is False, in which case
+       the local paths are returned for upload_clip_task)
+    
+    Returns [cand_id, {aspect: S3 URL or path}], or [cand_id, None] if the
+    candidate no longer exists.
+    """
+    db = SessionLocal()
+    report_progress = ProgressReporter(self)
+    
+    try:
         # Extract parameters
-        candidate_ids = params['candidate_ids']
         template = params.get('template', 'clean')
         outputs = params.get('outputs', ['9:16'])
         config = {
             'watermark': params.get('watermark', '@myanime'),
             'loudness': params.get('loudness', '-14'),
-            'captions': params.get('captions', 'on')
+            'captions': params.get('captions', 'on'),
+            'hwaccel': 'nvenc' if gpu else RENDER_HWACCEL,
+            'encode_profile': RENDER_ENCODE_PROFILE
         }
         
-        rendered_files = {}
-        total_renders = len(candidate_ids) * len(outputs)
-        current = 0
-        
-        for cand_id in candidate_ids:
-            candidate = db.query(Candidate).filter(Candidate.id == cand_id).first()
-            if not candidate:
-                continue
-            
-            video = db.query(Video).filter(Video.id == candidate.video_id).first()
-            transcript = db.query(Transcript).filter(
-                Transcript.video_id == candidate.video_id
-            ).first()
-            
-            # Download video
-            video_path = f"/tmp/videos/{video.id}.mp4"
-            if not os.path.exists(video_path):
-                download_from_s3(video.src_url, video_path)
-            
-            # Get captions for this segment
-            captions = []
-            if config['captions'] == 'on' and transcript:
-                for word in transcript.words:
-                    if candidate.start_s <= word['start'] <= candidate.end_s:
-                        captions.append(word)
-            
-            # Render each aspect ratio
-            for aspect in outputs:
-                current += 1
-                progress = int((current / total_renders) * 100)
-                self.update_state(
-                    state='PROGRESS',
-                    meta={'step': f'rendering_{aspect}', 'progress': progress}
-                )
+        # Candidate, source video and transcript words in one round-trip
+        candidate = db.query(
+            Candidate.start_s,
+            Candidate.end_s,
+            Video.id.label('video_id'),
+            Video.src_url,
+            Transcript.words
+        ).join(
+            Video, Video.id == Candidate.video_id
+        ).outerjoin(
+            Transcript, Transcript.video_id == Candidate.video_id
+        ).filter(
+            Candidate.id == cand_id
+        ).first()
+        
+        if not candidate:
+            return [cand_id, None]
+        
+        # Get captions for this segment (Whisper words are in start order)
+        captions = []
+        if config['captions'] == 'on' and candidate.words:
+            words = candidate.words
+            lo = bisect_left(words, candidate.start_s, key=itemgetter('start'))
+            hi = bisect_right(words, candidate.end_s, lo=lo, key=itemgetter('start'))
+            captions = words[lo:hi]
+        
+        # Outputs and scripts go in a private scratch directory, removed however the task ends
+        work_dir = make_scratch_dir(f"{cand_id}_")
+        try:
+            # The cached source stays locked against eviction while FFmpeg reads it
+            with video_cache.get_or_fetch(candidate.video_id, candidate.src_url) as video_path:
+                renderer = TemplateRenderer(video_path, os.path.join(work_dir, cand_id), config)
+                report_progress('rendering', 0)
                 
-                output_filename = f"{cand_id}_{aspect.replace(':', 'x')}.mp4"
-                output_path = f"/tmp/videos/{output_filename}"
+                if RENDER_STREAM_TO_S3:
+                    return [cand_id, renderer.render_to_s3(
+                        candidate.start_s,
+                        candidate.end_s,
+                        captions,
+                        template,
+                        outputs,
+                        f"renders/{render_id}"
+                    )]
                 
-                # Render
-                renderer = TemplateRenderer(video_path, output_path, config)
-                renderer.render(
+                output_paths = renderer.render(
                     candidate.start_s,
                     candidate.end_s,
                     captions,
                     template,
-                    aspect
+                    outputs
                 )
-                
-                # Upload
-                s3_key = f"renders/{render_id}/{output_filename}"
-                file_url = upload_to_s3(output_path, s3_key)
-                
-                # Track output
-                if cand_id not in rendered_files:
-                    rendered_files[cand_id] = {}
-                rendered_files[cand_id][aspect] = file_url
-                
-                # Cleanup
-                os.remove(output_path)
+            
+            if not upload:
+                # upload_clip_task uploads the files and removes work_dir
+                work_dir = None
+                return [cand_id, output_paths]
+            
+            report_progress('uploading', 90)
+            return [cand_id, upload_outputs(render_id, output_paths)]
+        finally:
+            if work_dir:
+                shutil.rmtree(work_dir, ignore_errors=True)
+    
+    finally:
+        db.close()
+
+
+@celery_app.task
+def upload_clip_task(result: List, render_id: str):
+    """Upload a clip rendered by render_clip_task(upload=False); I/O-bound, suits a gevent pool"""
+    cand_id, output_paths = result
+    if output_paths is None:
+        return result
+    
+    try:
+        return [cand_id, upload_outputs(render_id, output_paths)]
+    finally:
+        # The clip's scratch directory, handed over by render_clip_task
+        work_dir = os.path.dirname(next(iter(output_paths.values())))
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def upload_outputs(render_id: str, output_paths: Dict[str, str]) -> Dict[str, str]:
+    """Upload rendered files to renders/<render_id>/, returning {aspect: S3 URL}"""
+    files = {}
+    for aspect, output_path in output_paths.items():
+        s3_key = f"renders/{render_id}/{os.path.basename(output_path)}"
+        files[aspect] = upload_to_s3(output_path, s3_key)
+    
+    return files
+
+
+@celery_app.task
+def finalize_render_task(results: List, render_id: str):
+    """Chord callback: store every clip's files and complete the render"""
+    db = SessionLocal()
+    
+    try:
+        render = db.query(Render).filter(Render.id == render_id).first()
+        if not render:
+            raise ValueError("Render not found")
+        
+        rendered_files = {cand_id: files for cand_id, files in results if files}
         
         # Update render record
         render.status = 'completed'
         render.files = rendered_files
         db.commit()
+        release_active_renders_sync(render.user_id)
         
         return {'status': 'completed', 'files': rendered_files}
+    finally:
+        db.close()
+
+
+@celery_app.task
+def fail_render_task(request, exc, traceback, render_id: str):
+    """Chord error callback: mark the render failed when any clip fails"""
+    db = SessionLocal()
+    
+    try:
+        render = db.query(Render).filter(Render.id == render_id).first()
+        if not render or render.status != 'processing':
+            return
         
-    except Exception as e:
         render.status = 'failed'
-        render.files = {'error': str(e)}
+        render.files = {'error': str(exc)}
         db.commit()
-        raise
+        release_active_renders_sync(render.user_id)
     finally:
         db.close()
-        
\ No newline at end of file
@@ -129,6 +129,9 @@ else
     print_warning "Bucket might already exist"
 fi
 
+# Task arguments are deleted by the worker; expire any left by killed tasks
+docker-compose exec -T minio mc ilm rule add --expire-days 2 --prefix "task-args/" myminio/anime-clips
+
 echo ""
 
 # Install frontend dependencies (if running locally)